@@ -0,0 +1,119 @@
+import csv
+import io
+import math
+import threading
+import time
+import zipfile
+from itertools import islice
+from sqlalchemy.orm import Session
+from . import models, crud
+
+CHUNK_SIZE = 1000
+MAX_REJECTED_DETAILS = 100
+
+# SQLite takes one writer at a time; queueing concurrent imports here keeps
+# them from failing with "database is locked" once the busy timeout expires
+_chunk_write_lock = threading.Lock()
+
+
+def _iter_xlsx_rows(fileobj):
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, OSError) as e:
+        # corrupt or not really an .xlsx; reported in the import summary like other bad input
+        raise ValueError(f"could not read workbook: {e}") from e
+    try:
+        ws = wb.worksheets[0]
+        for row in ws.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        wb.close()
+
+
+def _iter_csv_rows(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        for row in csv.reader(text):
+            yield row
+    finally:
+        text.detach()
+
+
+def iter_rows(filename: str, fileobj):
+    """Yield rows (header first) from an .xlsx or .csv file without loading it whole."""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return _iter_csv_rows(fileobj)
+    if name.endswith(".xlsx"):
+        return _iter_xlsx_rows(fileobj)
+    raise ValueError("unsupported file type (use .xlsx or .csv)")
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if math.isnan(value):  # missing column or empty cell
+            return ""
+        # integral floats from Excel (e.g. 12.0) are stored as "12"
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def coerce_chunk(header: list, rows: list[list], fields: list[str]):
+    """Convert a chunk of raw rows to insertable dicts of strings.
+
+    Returns (records, rejected) where rejected holds the chunk offsets of
+    rows that carry no value for any report field.
+    """
+    import pandas as pd
+
+    width = len(header)
+    rows = [(list(r) + [None] * width)[:width] for r in rows]
+    df = pd.DataFrame(rows, columns=header, dtype=object)
+    df = df.loc[:, ~df.columns.duplicated()].reindex(columns=fields)
+    df = df.apply(lambda col: col.map(_cell_text))
+    blank = df.apply(lambda col: col.str.strip()) == ""
+    rejected_mask = blank.all(axis=1)
+    records = df[~rejected_mask].to_dict(orient="records")
+    rejected = [i for i, r in enumerate(rejected_mask.tolist()) if r]
+    return records, rejected
+
+
+def import_records(db: Session, report_type: models.ReportType, filename: str, fileobj, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Stream rows from the file into the report table, one transaction per chunk."""
+    start = time.perf_counter()
+    rows = iter_rows(filename, fileobj)
+    header = next(rows, None)
+    if header is None:
+        return {"rows": 0, "imported": 0, "rejected": 0, "rejected_rows": [], "elapsed": 0.0}
+    header = ["" if h is None else str(h).strip() for h in header]
+    total = imported = 0
+    rejected_rows: list[dict] = []
+    rejected_count = 0
+    line = 2  # spreadsheet row number of the first data row
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        records, rejected = coerce_chunk(header, chunk, report_type.fields)
+        with _chunk_write_lock:
+            crud.bulk_insert_report_records(db, report_type, records)
+        total += len(chunk)
+        imported += len(records)
+        rejected_count += len(rejected)
+        for i in rejected:
+            if len(rejected_rows) < MAX_REJECTED_DETAILS:
+                rejected_rows.append({"row": line + i, "reason": "no values for report fields"})
+        line += len(chunk)
+    return {
+        "rows": total,
+        "imported": imported,
+        "rejected": rejected_count,
+        "rejected_rows": rejected_rows,
+        "elapsed": round(time.perf_counter() - start, 3),
+    }
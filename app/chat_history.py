@@ -0,0 +1,68 @@
+"""Server-side history of AI chat conversations, bounded in memory.
+
+At most ``max_conversations`` conversations are kept (least recently used
+are dropped first), each limited to its last ``max_messages`` messages and
+``max_chars`` characters; conversations idle for ``ttl`` seconds expire.
+History lives in process memory and is lost on restart.
+"""
+import time
+import uuid
+from collections import OrderedDict, deque
+from .config import config_store
+
+# defaults, overridable with the "chat" section of config.json
+CHAT_DEFAULTS = {
+    "max_conversations": 1000,
+    "max_messages": 20,
+    "max_chars": 20000,
+    "ttl": 3600.0,
+}
+
+
+class ChatHistory:
+    def __init__(self, **options):
+        cfg = config_store.settings("chat", CHAT_DEFAULTS)
+        cfg.update(options)
+        self.max_conversations = int(cfg["max_conversations"])
+        self.max_messages = int(cfg["max_messages"])
+        self.max_chars = int(cfg["max_chars"])
+        self.ttl = float(cfg["ttl"])
+        # id -> (last_used, deque of messages)
+        self._conversations: OrderedDict[str, tuple[float, deque]] = OrderedDict()
+
+    def _expire(self, now: float):
+        while self._conversations:
+            cid, (last_used, _) = next(iter(self._conversations.items()))
+            if now - last_used < self.ttl and len(self._conversations) <= self.max_conversations:
+                break
+            del self._conversations[cid]
+
+    def messages(self, conversation_id: str | None) -> tuple[str, list[dict]]:
+        """Return (conversation_id, prior messages); unknown or expired ids start a new conversation."""
+        now = time.time()
+        self._expire(now)
+        entry = self._conversations.get(conversation_id) if conversation_id else None
+        if entry is None:
+            return uuid.uuid4().hex, []
+        return conversation_id, list(entry[1])
+
+    def append(self, conversation_id: str, user: str, assistant: str):
+        now = time.time()
+        entry = self._conversations.pop(conversation_id, None)
+        history = entry[1] if entry else deque(maxlen=self.max_messages)
+        history.append({"role": "user", "content": user})
+        history.append({"role": "assistant", "content": assistant})
+        while len(history) > 2 and sum(len(m["content"]) for m in history) > self.max_chars:
+            history.popleft()
+            history.popleft()
+        self._conversations[conversation_id] = (now, history)
+        self._expire(now)
+
+    def reset(self, conversation_id: str):
+        self._conversations.pop(conversation_id, None)
+
+    def __len__(self):
+        return len(self._conversations)
+
+
+chat_history = ChatHistory()
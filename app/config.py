@@ -1,27 +1,217 @@
+import copy
 import json
+import logging
 import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
 
-CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
+try:
+    import fcntl
+except ImportError:  # Windows: writes are still atomic, but not serialised across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# CONFIG_FILE in the environment points every worker process at a shared file
+CONFIG_FILE = os.getenv('CONFIG_FILE') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
+
+
+@dataclass(frozen=True)
+class OpenAIConfig:
+    """Resolved OpenAI client settings (config.json first, then environment)."""
+    key: str | None
+    endpoint: str | None
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(
+            key=data.get("key") or os.getenv("OPENAI_API_KEY"),
+            endpoint=data.get("endpoint") or os.getenv("OPENAI_ENDPOINT"),
+        )
+
+
+class ConfigStore:
+    """In-memory copy of config.json, shared safely by several worker processes.
+
+    The file is re-read only when it changes on disk (checked at most every
+    ``check_interval`` seconds, on access or by the ``start_watching``
+    thread) or after ``save``. Readers get a snapshot swapped in as a whole,
+    so they never see a half-updated config.
+
+    Writes go to a temporary file that replaces config.json atomically,
+    under an exclusive lock on ``<path>.lock``; ``update_section`` re-reads
+    the file inside the lock, so concurrent updates from other processes
+    are not lost. Callbacks registered with ``subscribe`` are called with
+    the names of the top-level sections that changed, whichever process
+    wrote them.
+    """
+
+    def __init__(self, path: str = CONFIG_FILE, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._version = None
+        self._checked = 0.0
+        self._snapshot = ({}, OpenAIConfig.from_dict({}))
+        self._loaded = False
+        self._listeners = []
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def _file_version(self):
+        # the inode changes on every atomic replace, even within the mtime resolution
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_ino, st.st_size
+
+    def _read(self) -> dict:
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write(self, cfg: dict):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), prefix='.config-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(cfg, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _install(self, data: dict, version) -> set[str]:
+        """Swap in a new snapshot; returns the changed sections (empty on first load)."""
+        old = self._snapshot[0] if self._loaded else None
+        self._snapshot = (data, OpenAIConfig.from_dict(data.get('openai', {})))
+        self._version = version
+        self._checked = time.monotonic()
+        self._loaded = True
+        if old is None:
+            return set()
+        return {k for k in old.keys() | data.keys() if old.get(k) != data.get(k)}
+
+    def _notify(self, sections: set[str]):
+        for callback in list(self._listeners):
+            try:
+                callback(sections)
+            except Exception:
+                logger.exception("config listener %r failed", callback)
+
+    def _refresh(self, force: bool = False):
+        now = time.monotonic()
+        if self._loaded and not force and now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            self._checked = now
+            version = self._file_version()
+            if self._loaded and version == self._version:
+                return
+            changed = self._install(self._read(), version)
+        if changed:
+            self._notify(changed)
+
+    def get(self) -> dict:
+        """Return a private copy of the whole config."""
+        self._refresh()
+        return copy.deepcopy(self._snapshot[0])
+
+    def section(self, name: str) -> dict:
+        self._refresh()
+        return copy.deepcopy(self._snapshot[0].get(name, {}))
+
+    def settings(self, name: str, defaults: dict, known_only: bool = False) -> dict:
+        """``defaults`` overridden by the section's values (only keys of ``defaults`` if ``known_only``)."""
+        cfg = dict(defaults)
+        section = self.section(name)
+        cfg.update({k: v for k, v in section.items() if k in defaults} if known_only else section)
+        return cfg
+
+    def openai(self) -> OpenAIConfig:
+        self._refresh()
+        return self._snapshot[1]
+
+    def save(self, cfg: dict):
+        with self._lock, self._file_lock():
+            self._write(cfg)
+            changed = self._install(copy.deepcopy(cfg), self._file_version())
+        if changed:
+            self._notify(changed)
+
+    def update_section(self, name: str, data: dict):
+        """Replace one top-level section and save."""
+        with self._lock, self._file_lock():
+            cfg = self._read()
+            cfg[name] = data
+            self._write(cfg)
+            changed = self._install(copy.deepcopy(cfg), self._file_version())
+        if changed:
+            self._notify(changed)
+
+    def subscribe(self, callback):
+        """Call ``callback(sections)`` whenever top-level sections of the config change."""
+        self._listeners.append(callback)
+
+    def start_watching(self):
+        """Poll the file in a background thread so changes from other processes are announced promptly."""
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(self.check_interval):
+                try:
+                    self._refresh(force=True)
+                except Exception:
+                    logger.exception("reloading %s failed", self.path)
+
+        self._watcher = threading.Thread(target=run, name="config-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+
+
+config_store = ConfigStore()
 
 
 def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return config_store.get()
 
 
 def save_config(cfg: dict):
-    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(cfg, f)
+    config_store.save(cfg)
 
 
 def load_openai_config():
-    cfg = load_config()
-    return cfg.get('openai', {})
+    return config_store.section('openai')
+
+
+def get_openai_settings() -> OpenAIConfig:
+    return config_store.openai()
 
 
 def save_openai_config(data: dict):
-    cfg = load_config()
-    cfg['openai'] = data
-    save_config(cfg)
+    config_store.update_section('openai', data)
@@ -1,14 +1,19 @@
+import asyncio
+import base64
+import html
+import json
+from sqlalchemy import and_, or_, select
 from sqlalchemy.orm import Session
-from . import models
-from .report_dal import (
-    get_report_table,
-    drop_report_table,
-    rename_column,
-    delete_records,
-    get_question_table,
-    drop_question_table,
-    rename_question_column,
-)
+from . import models, write_queue, metadata_cache, record_store
+from .parse_cache import parse_cache
+from .record_store import store_for
+from .report_stats import render, stats_cache, stats_settings
+
+
+def search_fields(report_type: models.ReportType) -> list[str]:
+    """Fields covered by the full-text index (text answers, not media)."""
+    return record_store.search_fields(report_type.fields, report_type.field_types)
+
 
 def create_report_type(
     db: Session,
@@ -19,20 +24,20 @@ def create_report_type(
     mode: str,
     prompt: str | None = None,
 ):
-    """Create a new report type with associated tables."""
+    """Create a new report type with storage in the configured backend."""
+    store = record_store.new_store()
     rt = models.ReportType(
         name=name, fields=fields, field_types=types, mode=mode, prompt=prompt
     )
     db.add(rt)
     db.commit()
     db.refresh(rt)
-    get_report_table(rt.id, fields)
-    if mode == "struct":
-        q_table = get_question_table(rt.id, fields)
-        if questions:
-            data = {f: q for f, q in zip(fields, questions)}
-            db.execute(q_table.insert().values(**data))
-            db.commit()
+    store.create(rt)
+    record_store.register(rt.id, store)
+    if mode == "struct" and questions:
+        store.set_questions(db, rt, {f: q for f, q in zip(fields, questions)})
+        db.commit()
+    metadata_cache.bump(rt.id, catalog=True)
     return rt
 
 
@@ -48,73 +53,271 @@ def get_report_type_by_name(db: Session, name: str):
     return db.query(models.ReportType).filter(models.ReportType.name == name).first()
 
 def insert_report_record(db: Session, report_type: models.ReportType, data: dict):
-    table = get_report_table(report_type.id, report_type.fields)
-    insert_stmt = table.insert().values(**data)
-    db.execute(insert_stmt)
+    if write_queue.writer is not None:
+        write_queue.writer.submit(report_type.id, report_type.fields, data).result()
+    else:
+        store_for(report_type.id).insert_rows(db, report_type.id, report_type.fields, [data])
+        db.commit()
+    stats_cache.records_inserted(report_type, [data])
+
+
+async def ainsert_report_record(db: Session, report_type: models.ReportType, data: dict):
+    """insert_report_record for async endpoints; waits for a group commit without blocking the loop."""
+    if write_queue.writer is not None:
+        await asyncio.wrap_future(
+            write_queue.writer.submit(report_type.id, report_type.fields, data)
+        )
+        stats_cache.records_inserted(report_type, [data])
+    else:
+        insert_report_record(db, report_type, data)
+
+
+def bulk_insert_report_records(db: Session, report_type: models.ReportType, rows: list[dict]):
+    """Insert many records with a single executemany and one commit."""
+    if not rows:
+        return
+    store_for(report_type.id).insert_rows(db, report_type.id, report_type.fields, rows)
     db.commit()
+    stats_cache.records_inserted(report_type, rows)
 
 
 def update_report_record(db: Session, report_type: models.ReportType, rec_id: int, data: dict):
-    table = get_report_table(report_type.id, report_type.fields)
-    stmt = table.update().where(table.c.id == rec_id).values(**data)
-    db.execute(stmt)
+    store_for(report_type.id).update(db, report_type, rec_id, data)
     db.commit()
+    stats_cache.invalidate(report_type.id)
+
 
+def encode_cursor(value, rec_id: int) -> str:
+    raw = json.dumps([value, rec_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
 
-def fetch_report_records(db: Session, report_type: models.ReportType):
-    table = get_report_table(report_type.id, report_type.fields)
+
+def decode_cursor(cursor: str):
+    try:
+        value, rec_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return value, int(rec_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def fetch_report_records_page(
+    db: Session,
+    report_type: models.ReportType,
+    limit: int = 50,
+    cursor: str | None = None,
+    sort: str = "id",
+    descending: bool = False,
+    filter_field: str | None = None,
+    filter_value: str | None = None,
+):
+    """Return one page of records and the cursor of the next page.
+
+    Paging is keyset based on (sort column, id), so the cost of a page does
+    not grow with its position in the table. Sorting or filtering on a field
+    creates an index on (field, id) the first time it is used.
+    """
+    if sort != "id" and sort not in report_type.fields:
+        raise ValueError(f"unknown sort field: {sort}")
+    if filter_field and filter_field not in report_type.fields:
+        raise ValueError(f"unknown filter field: {filter_field}")
+    store = store_for(report_type.id)
+    table = store.records(report_type)
     sel = table.select()
-    res = db.execute(sel)
-    return [dict(r) for r in res]
+    if filter_field:
+        store.ensure_index(report_type, filter_field)
+        sel = sel.where(table.c[filter_field] == filter_value)
+    id_col = table.c.id
+    if sort == "id":
+        col = None
+        order = [id_col.desc() if descending else id_col]
+    else:
+        store.ensure_index(report_type, sort)
+        col = table.c[sort]
+        order = [col.desc(), id_col.desc()] if descending else [col, id_col]
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        # NULL sorts first ascending and last descending in SQLite
+        if col is None:
+            cond = id_col < last_id if descending else id_col > last_id
+        elif descending and value is None:
+            cond = and_(col.is_(None), id_col < last_id)
+        elif descending:
+            cond = or_(col < value, and_(col == value, id_col < last_id), col.is_(None))
+        elif value is None:
+            cond = or_(col.isnot(None), and_(col.is_(None), id_col > last_id))
+        else:
+            cond = or_(col > value, and_(col == value, id_col > last_id))
+        sel = sel.where(cond)
+    sel = sel.order_by(*order).limit(limit + 1)
+    rows = [dict(r) for r in db.execute(sel)]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(None if col is None else last[sort], last["id"])
+    return rows, next_cursor
+
+
+def fetch_changes(db: Session, report_type: models.ReportType, since: int = 0, limit: int = 500):
+    """Return records changed after change sequence ``since`` and the cursor to resume from.
+
+    Each change is the record's latest state: ``{"seq", "id", "op",
+    "created_at", "updated_at", "record"}`` where ``op`` is ``upsert`` (with
+    the current field values) or ``delete`` (a tombstone, ``record`` is
+    None). Pass the returned cursor as ``since`` on the next call.
+    """
+    store = store_for(report_type.id)
+    table = store.records(report_type)
+    log = store.change_log(report_type)
+    sel = (
+        select([log.c.seq, log.c.record_id, log.c.deleted, log.c.created_at, log.c.updated_at]
+               + [table.c[f] for f in report_type.fields])
+        .select_from(log.outerjoin(table, table.c.id == log.c.record_id))
+        .where(log.c.seq > since)
+        .order_by(log.c.seq)
+        .limit(limit + 1)
+    )
+    rows = db.execute(sel).fetchall()
+    has_more = len(rows) > limit
+    changes = []
+    for row in rows[:limit]:
+        deleted = bool(row[2])
+        changes.append(
+            {
+                "seq": row[0],
+                "id": row[1],
+                "op": "delete" if deleted else "upsert",
+                "created_at": row[3],
+                "updated_at": row[4],
+                "record": None if deleted else dict(zip(report_type.fields, row[5:])),
+            }
+        )
+    next_since = changes[-1]["seq"] if changes else since
+    return changes, next_since, has_more
+
+
+def fetch_report_stats(report_type: models.ReportType) -> dict:
+    """Record count, per-field fill rates, answer distributions and per-day volume.
+
+    Served from the stats cache when it is current; see report_stats.
+    """
+    settings = stats_settings()
+    stats, cached = stats_cache.get(report_type, settings)
+    return {**render(report_type, stats, settings), "cached": cached}
 
 
 def fetch_question_prompts(db: Session, report_type: models.ReportType):
     if report_type.mode != "struct":
         return {}
-    table = get_question_table(report_type.id, report_type.fields)
-    sel = table.select()
-    res = db.execute(sel).fetchone()
-    if not res:
-        return {}
-    return {f: res[f] for f in report_type.fields}
+    return store_for(report_type.id).get_questions(db, report_type) or {}
 
 
 def update_question_prompts(db: Session, report_type: models.ReportType, questions: list[str]):
-    table = get_question_table(report_type.id, report_type.fields)
-    existing = db.execute(table.select()).fetchone()
     data = {f: q for f, q in zip(report_type.fields, questions)}
-    if existing:
-        db.execute(table.update().where(table.c.id == existing["id"]).values(**data))
-    else:
-        db.execute(table.insert().values(**data))
+    store_for(report_type.id).set_questions(db, report_type, data)
     db.commit()
+    metadata_cache.bump(report_type.id)
 
 
 def update_report_prompt(db: Session, report_type: models.ReportType, prompt: str):
     report_type.prompt = prompt
     db.commit()
+    metadata_cache.bump(report_type.id)
 
 
 def delete_report_type(db: Session, rt: models.ReportType):
-    drop_report_table(rt.id)
-    drop_question_table(rt.id)
+    store_for(rt.id).drop(rt.id)
+    record_store.forget(rt.id)
     db.delete(rt)
     db.commit()
+    # the id may be reused; drop cached results in every worker's memory tier too
+    parse_cache.purge(rt.id)
+    metadata_cache.bump(rt.id, catalog=True)
+    stats_cache.invalidate(rt.id)
 
 
 def delete_report_records(db: Session, report_type: models.ReportType, ids: list[int]):
-    delete_records(report_type.id, ids)
+    store_for(report_type.id).delete(db, report_type, ids)
     db.commit()
+    stats_cache.invalidate(report_type.id)
 
 
 def update_report_type_fields(db: Session, rt: models.ReportType, new_fields: list[str]):
-    for old, new in zip(rt.fields, new_fields):
-        if old != new:
-            rename_column(rt.id, old, new)
-            if rt.mode == "struct":
-                rename_question_column(rt.id, old, new)
+    store = store_for(rt.id)
+    renamed = store.rename_fields(rt, new_fields)
     rt.fields = new_fields
     if rt.field_types:
         rt.field_types = rt.field_types[: len(new_fields)]
     db.commit()
     db.refresh(rt)
+    metadata_cache.bump(rt.id)
+    store.fields_changed(rt, renamed)
+    stats_cache.invalidate(rt.id)
+
+
+def rebuild_search_index(report_type: models.ReportType):
+    """Recreate the report's full-text index from its current rows."""
+    store_for(report_type.id).rebuild_search_index(report_type)
+
+
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+
+def _highlight(snippet: str | None) -> str | None:
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def _like_snippet(values: list, terms: list[str], width: int = 20) -> str | None:
+    for v in values:
+        if not v:
+            continue
+        pos = v.find(terms[0])
+        if pos >= 0:
+            start = max(0, pos - width)
+            end = pos + len(terms[0])
+            return (
+                ("…" if start else "") + v[start:pos] + _MARK_START + v[pos:end] + _MARK_END
+                + v[end:end + width] + ("…" if end + width < len(v) else "")
+            )
+    return None
+
+
+def search_report_records(db: Session, report_type: models.ReportType, q: str, limit: int = 20, offset: int = 0):
+    """Full-text search over the report's text fields.
+
+    Whitespace separated terms are ANDed. Results are ranked by bm25 and
+    carry an HTML-escaped snippet with matches wrapped in <mark>. The
+    trigram index needs terms of 3+ characters; shorter terms fall back to
+    a LIKE scan ordered by newest first. Returns (results, next_offset).
+    """
+    terms = q.split()
+    fields = search_fields(report_type)
+    if not terms or not fields:
+        return [], None
+    store = store_for(report_type.id)
+    if not store.has_search_index(report_type):
+        store.rebuild_search_index(report_type)
+    table = store.records(report_type)
+    if all(len(t) >= 3 for t in terms):
+        match = " AND ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        rows = store.search(db, report_type, match, (_MARK_START, _MARK_END), limit + 1, offset)
+        for r in rows:
+            r["snippet"] = _highlight(r["snippet"])
+            r["rank"] = round(-r["rank"], 6)
+    else:
+        conds = []
+        for t in terms:
+            pattern = "%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            conds.append(or_(*[table.c[f].like(pattern, escape="\\") for f in fields]))
+        sel = table.select().where(and_(*conds)).order_by(table.c.id.desc()).limit(limit + 1).offset(offset)
+        rows = [dict(r) for r in db.execute(sel)]
+        for r in rows:
+            r["snippet"] = _highlight(_like_snippet([r[f] for f in fields], terms))
+            r["rank"] = None
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = offset + limit
+    return rows, next_offset
@@ -1,7 +1,108 @@
-from sqlalchemy import create_engine
+import os
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+from .config import config_store
+
+# connection settings, overridable with the "database" section of config.json;
+# the DATABASE_URL environment variable takes precedence over "url"
+ENGINE_DEFAULTS = {
+    "url": "sqlite:///./data.db",
+    "pool_size": 10,
+    "max_overflow": 30,
+    "pool_timeout": 30,
+    "pool_recycle": -1,
+    "pool_pre_ping": False,
+}
+
+# SQLite tuning, overridable with the "database" section of config.json
+SQLITE_DEFAULTS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout_ms": 5000,
+    "cache_size_kb": 64 * 1024,
+    "mmap_size": 256 * 1024 * 1024,
+}
+
+
+def engine_settings() -> dict:
+    cfg = config_store.settings("database", ENGINE_DEFAULTS, known_only=True)
+    if os.getenv("DATABASE_URL"):
+        cfg["url"] = os.environ["DATABASE_URL"]
+    return cfg
+
+
+def sqlite_settings() -> dict:
+    return config_store.settings("database", SQLITE_DEFAULTS, known_only=True)
+
+
+def _apply_pragmas(dbapi_conn, settings: dict):
+    cur = dbapi_conn.cursor()
+    cur.execute(f"PRAGMA journal_mode={settings['journal_mode']}")
+    cur.execute(f"PRAGMA synchronous={settings['synchronous']}")
+    cur.execute(f"PRAGMA busy_timeout={int(settings['busy_timeout_ms'])}")
+    # negative cache_size is in KiB rather than pages
+    cur.execute(f"PRAGMA cache_size=-{int(settings['cache_size_kb'])}")
+    cur.execute(f"PRAGMA mmap_size={int(settings['mmap_size'])}")
+    cur.close()
+
+
+def _create_engine(settings: dict):
+    url = make_url(settings["url"])
+    kwargs = {"pool_pre_ping": bool(settings["pool_pre_ping"]), "pool_recycle": int(settings["pool_recycle"])}
+    if url.get_backend_name() == "sqlite":
+        kwargs["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # keep SQLAlchemy's per-thread pool; each new connection would be a new empty database
+            return create_engine(url, **kwargs)
+        # SQLAlchemy 1.4 defaults file databases to NullPool, reconnecting and re-running the PRAGMAs per session
+        kwargs["poolclass"] = QueuePool
+    kwargs.update(
+        pool_size=int(settings["pool_size"]),
+        max_overflow=int(settings["max_overflow"]),
+        pool_timeout=float(settings["pool_timeout"]),
+    )
+    return create_engine(url, **kwargs)
+
+
+DATABASE_URL = engine_settings()["url"]
+engine = _create_engine(engine_settings())
+IS_SQLITE = engine.dialect.name == "sqlite"
+_sqlite_settings = sqlite_settings()
+
+
+def _settings_changed(sections: set[str]):
+    """Config listener: PRAGMAs apply to connections opened from now on."""
+    global _sqlite_settings
+    if "database" in sections:
+        _sqlite_settings = sqlite_settings()
+
+
+config_store.subscribe(_settings_changed)
+
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, connection_record):
+        _apply_pragmas(dbapi_conn, _sqlite_settings)
+
 
-DATABASE_URL = 'sqlite:///./data.db'
-engine = create_engine(DATABASE_URL, connect_args={'check_same_thread': False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+
+def create_schema():
+    """Create missing tables; safe when several workers start at once."""
+    for attempt in range(5):
+        try:
+            Base.metadata.create_all(bind=engine)
+            return
+        except OperationalError:
+            # another worker created a table between the existence check and CREATE TABLE,
+            # or still holds the write lock; back off before checking again
+            if attempt == 4:
+                raise
+            time.sleep(0.1 * 2**attempt)
@@ -0,0 +1,219 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from . import models
+from .database import engine
+from .record_store import store_for
+
+BATCH_SIZE = 1000
+FILE_CHUNK_SIZE = 64 * 1024
+MAX_BATCH_RECORDS = 5000
+EXPORT_CACHE_BYTES = 64 * 1024 * 1024
+
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_MEDIA_TYPE = "application/zip"
+
+
+def _stream_rows(sel, batch_size: int):
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(sel)
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [tuple(r) for r in rows]
+
+
+def iter_record_batches(
+    report_type: models.ReportType,
+    ids: list[int] | None = None,
+    filter_field: str | None = None,
+    filter_value: str | None = None,
+    batch_size: int = BATCH_SIZE,
+):
+    """Return a generator of row-tuple lists (id, *fields) read from a streaming cursor.
+
+    Arguments are validated eagerly; the generator uses its own connection
+    so it can outlive the request session.
+    """
+    if filter_field and filter_field not in report_type.fields:
+        raise ValueError(f"unknown filter field: {filter_field}")
+    store = store_for(report_type.id)
+    table = store.records(report_type)
+    cols = [table.c.id] + [table.c[f] for f in report_type.fields]
+    sel = table.select().with_only_columns(cols).order_by(table.c.id)
+    if ids:
+        sel = sel.where(table.c.id.in_(ids))
+    if filter_field:
+        store.ensure_index(report_type, filter_field)
+        sel = sel.where(table.c[filter_field] == filter_value)
+    return _stream_rows(sel, batch_size)
+
+
+def stream_csv(report_type: models.ReportType, batches):
+    """Yield the CSV export as UTF-8 bytes (with BOM so Excel detects the encoding)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["id"] + list(report_type.fields))
+    yield ("\ufeff" + buf.getvalue()).encode("utf-8")
+    for rows in batches:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+
+
+def write_xlsx(report_type: models.ReportType, batches) -> str:
+    """Write the export to a temporary .xlsx file with openpyxl write-only mode.
+
+    Rows are flushed to disk as they are appended, so memory stays constant.
+    Returns the file path; the caller removes it.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["id"] + list(report_type.fields))
+    for rows in batches:
+        for row in rows:
+            ws.append(row)
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def iter_file(path: str, remove: bool = True):
+    """Yield the file in fixed-size chunks, deleting it afterwards."""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove:
+            os.remove(path)
+
+
+def iter_bytes(data: bytes):
+    for i in range(0, len(data), FILE_CHUNK_SIZE):
+        yield data[i:i + FILE_CHUNK_SIZE]
+
+
+def fetch_records(report_type: models.ReportType, ids: list[int]) -> list[tuple]:
+    """Return (id, *fields) tuples for the given ids, ordered by id."""
+    table = store_for(report_type.id).records(report_type)
+    cols = [table.c.id] + [table.c[f] for f in report_type.fields]
+    sel = table.select().with_only_columns(cols).where(table.c.id.in_(ids)).order_by(table.c.id)
+    with engine.connect() as conn:
+        return [tuple(r) for r in conn.execute(sel)]
+
+
+def version_stamp(report_type: models.ReportType, rows: list[tuple]) -> str:
+    """Digest of the field names and row contents; changes whenever any exported value does."""
+    payload = json.dumps([report_type.fields, rows], default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _workbook_bytes(header: list, rows) -> bytes:
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(header)
+    for row in rows:
+        ws.append(list(row))
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def build_excel(report_type: models.ReportType, rows: list[tuple], layout: str) -> bytes:
+    """Build the export for ``layout``.
+
+    ``record``: one record without id column (the single-record download),
+    ``workbook``: one sheet with a row per record, ``zip``: an archive of
+    per-record workbooks named ``record_<id>.xlsx``.
+    """
+    fields = list(report_type.fields)
+    if layout == "record":
+        return _workbook_bytes(fields, [row[1:] for row in rows])
+    if layout == "workbook":
+        return _workbook_bytes(["id"] + fields, rows)
+    buf = io.BytesIO()
+    # xlsx files are already deflated; storing them avoids compressing twice
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        for row in rows:
+            zf.writestr(f"record_{row[0]}.xlsx", _workbook_bytes(fields, [row[1:]]))
+    return buf.getvalue()
+
+
+class ExportCache:
+    """LRU of built exports bounded by total size in bytes."""
+
+    def __init__(self, max_bytes: int = EXPORT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+export_cache = ExportCache()
+
+
+def excel_export(report_type: models.ReportType, ids: list[int], layout: str) -> tuple[bytes | None, bool]:
+    """Return (data, cached) for the records with ``ids``; data is None if none exist.
+
+    Identical requests are served from ``export_cache``; the key includes
+    a stamp of the current row contents, so edits, deletes and renames
+    never return a stale file. Blocking; call it from a worker thread.
+    """
+    rows = fetch_records(report_type, ids)
+    if not rows:
+        return None, False
+    key = f"{report_type.id}:{layout}:{version_stamp(report_type, rows)}"
+    data = export_cache.get(key)
+    if data is not None:
+        return data, True
+    data = build_excel(report_type, rows, layout)
+    export_cache.put(key, data)
+    return data, False
+
@@ -0,0 +1,132 @@
+"""Token-aware splitting of long texts and merging of per-chunk extractions.
+
+Texts whose prompt fits in ``single_pass_tokens`` are parsed with one
+call as before. Longer texts are split on line/sentence boundaries into
+chunks of at most ``chunk_tokens`` with ``overlap_tokens`` of trailing
+context repeated at the start of the next chunk (so a fact cut at a
+boundary is seen whole at least once). Fields are extracted from every
+chunk concurrently and merged with ``merge_results``.
+
+Merge rule, per field: empty values (missing, null, blank strings, empty
+lists/objects) are ignored. Among the rest, the value reported by the most
+chunks wins, which also discounts a fact read twice only because it sits
+in an overlap; ties go to the value from the earliest chunk. A field no
+chunk filled is returned as "". If no chunk returned a JSON object at all,
+the result is ``{}`` like a failed single-pass call, so it is not cached.
+"""
+import json
+import re
+from .config import config_store
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# defaults, overridable with the "extraction" section of config.json
+EXTRACTION_DEFAULTS = {
+    "single_pass_tokens": 6000,
+    "chunk_tokens": 3000,
+    "overlap_tokens": 200,
+    "max_chunks": 8,
+}
+
+_CJK_RE = re.compile(r"[⺀-鿿豈-﫿＀-￯]")
+# break after line ends and sentence ends (Japanese and Latin)
+_SPLIT_RE = re.compile(r"(?<=\n)|(?<=[。！？!?])|(?<=\. )")
+_encoder = None
+
+
+def extraction_settings() -> dict:
+    return config_store.settings("extraction", EXTRACTION_DEFAULTS)
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, otherwise an estimate.
+
+    The estimate counts CJK characters as one token each and other text as
+    one token per four characters, which errs on the high side for GPT-4
+    tokenizers.
+    """
+    global _encoder
+    if tiktoken is not None:
+        if _encoder is None:
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        return len(_encoder.encode(text))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _units(text: str, max_tokens: int) -> list[tuple[str, int]]:
+    units = []
+    for piece in _SPLIT_RE.split(text):
+        if not piece:
+            continue
+        n = count_tokens(piece)
+        if n <= max_tokens:
+            units.append((piece, n))
+            continue
+        # a single sentence longer than a chunk: cut it by characters
+        step = max(1, len(piece) * max_tokens // n)
+        for i in range(0, len(piece), step):
+            part = piece[i:i + step]
+            units.append((part, count_tokens(part)))
+    return units
+
+
+def split_text(text: str, chunk_tokens: int, overlap_tokens: int) -> list[str]:
+    """Split ``text`` into chunks of at most ``chunk_tokens`` that overlap by about ``overlap_tokens``."""
+    overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+    chunks: list[str] = []
+    current: list[tuple[str, int]] = []
+    size = 0
+    for unit in _units(text, chunk_tokens - overlap_tokens):
+        if current and size + unit[1] > chunk_tokens:
+            chunks.append("".join(u for u, _ in current))
+            # carry the tail of this chunk into the next one
+            carried: list[tuple[str, int]] = []
+            carried_size = 0
+            for u in reversed(current):
+                if carried_size + u[1] > overlap_tokens:
+                    break
+                carried.insert(0, u)
+                carried_size += u[1]
+            current, size = carried, carried_size
+        current.append(unit)
+        size += unit[1]
+    if current:
+        chunks.append("".join(u for u, _ in current))
+    return chunks
+
+
+def _is_empty(value) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    if isinstance(value, (list, dict)):
+        return not value
+    return False
+
+
+def merge_results(fields: list[str], results: list[dict]) -> dict:
+    """Merge per-chunk extractions (in chunk order) with the rule in the module docstring."""
+    if not any(isinstance(result, dict) and result for result in results):
+        return {}
+    merged = {}
+    for f in fields:
+        votes: dict[str, list] = {}  # serialized value -> [count, first chunk, value]
+        for i, result in enumerate(results):
+            value = result.get(f) if isinstance(result, dict) else None
+            if _is_empty(value):
+                continue
+            key = json.dumps(value, ensure_ascii=False, sort_keys=True)
+            if key in votes:
+                votes[key][0] += 1
+            else:
+                votes[key] = [1, i, value]
+        if votes:
+            merged[f] = max(votes.values(), key=lambda v: (v[0], -v[1]))[2]
+        else:
+            merged[f] = ""
+    return merged
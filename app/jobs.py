@@ -0,0 +1,248 @@
+"""Background GPT parse jobs persisted in the ``parse_jobs`` table.
+
+Submitting stores the raw input and returns immediately; a pool of worker
+tasks claims queued jobs, runs ``aparse_text_to_fields`` and inserts the
+record. Jobs interrupted by a shutdown are put back in the queue; jobs
+whose worker process died are requeued once they have been running for
+``lease`` seconds, by whichever worker process notices first. Failed
+attempts are retried with a delay up to ``max_attempts`` times.
+"""
+import asyncio
+import logging
+import time
+from . import models, crud
+from .config import config_store
+from .database import SessionLocal
+from .openai_util import aparse_text_to_fields
+
+logger = logging.getLogger(__name__)
+
+# defaults, overridable with the "jobs" section of config.json
+JOB_DEFAULTS = {
+    "workers": 2,
+    "max_attempts": 3,
+    "retry_delay": 5.0,
+    "poll_interval": 2.0,
+    "lease": 300.0,
+}
+
+
+def job_settings() -> dict:
+    return config_store.settings("jobs", JOB_DEFAULTS)
+
+
+def job_to_dict(job: models.ParseJob) -> dict:
+    return {
+        "id": job.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+def enqueue_job(db, report_type: models.ReportType, payload: dict) -> models.ParseJob:
+    now = time.time()
+    job = models.ParseJob(
+        report_type_id=report_type.id,
+        status="queued",
+        payload=payload,
+        attempts=0,
+        run_after=0.0,
+        created_at=now,
+        updated_at=now,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    job_queue.notify()
+    return job
+
+
+def get_job(db, job_id: int) -> models.ParseJob | None:
+    return db.query(models.ParseJob).filter(models.ParseJob.id == job_id).first()
+
+
+def requeue_interrupted(lease: float) -> int:
+    """Put jobs running for longer than ``lease`` seconds back in the queue.
+
+    Other worker processes may be running jobs right now, so only jobs
+    older than the lease are taken to be abandoned.
+    """
+    db = SessionLocal()
+    try:
+        n = db.query(models.ParseJob).filter(
+            models.ParseJob.status == "running", models.ParseJob.updated_at < time.time() - lease
+        ).update(
+            {"status": "queued", "updated_at": time.time()}, synchronize_session=False
+        )
+        db.commit()
+        return n
+    finally:
+        db.close()
+
+
+def _claim_next():
+    """Atomically move the oldest runnable job to running; returns (id, rt_id, payload) or None."""
+    db = SessionLocal()
+    try:
+        while True:
+            now = time.time()
+            job = (
+                db.query(models.ParseJob)
+                .filter(models.ParseJob.status == "queued", models.ParseJob.run_after <= now)
+                .order_by(models.ParseJob.id)
+                .first()
+            )
+            if job is None:
+                return None
+            claimed = (
+                db.query(models.ParseJob)
+                .filter(models.ParseJob.id == job.id, models.ParseJob.status == "queued")
+                .update(
+                    {"status": "running", "attempts": models.ParseJob.attempts + 1, "updated_at": now},
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+            if claimed:
+                return job.id, job.report_type_id, job.payload
+            # another worker won the race; try the next job
+            db.expire_all()
+    finally:
+        db.close()
+
+
+def _finish(job_id: int, status: str, result: dict | None = None, error: str | None = None, retry_delay: float = 0.0):
+    db = SessionLocal()
+    try:
+        job = get_job(db, job_id)
+        job.status = status
+        job.result = result
+        job.error = error
+        job.updated_at = time.time()
+        if status == "queued":
+            job.run_after = job.updated_at + retry_delay
+        db.commit()
+    finally:
+        db.close()
+
+
+def _attempts(job_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return get_job(db, job_id).attempts
+    finally:
+        db.close()
+
+
+async def run_job(job_id: int, report_type_id: int, payload: dict) -> dict:
+    db = SessionLocal()
+    try:
+        rt = crud.get_report_type(db, report_type_id)
+        if rt is None:
+            raise RuntimeError("report type not found")
+        if "text" in payload:
+            data = {}
+            parsed = await aparse_text_to_fields(payload["text"], rt.fields, rt.id, payload.get("use_cache", True))
+        else:
+            data = dict(payload.get("data") or {})
+            parsed = await aparse_text_to_fields(payload["free_text"], payload["free_fields"], rt.id)
+        if not parsed or not isinstance(parsed, dict):
+            # retried like any other failure instead of storing a blank record
+            raise RuntimeError("no JSON in response")
+        data.update(parsed)
+        await crud.ainsert_report_record(db, rt, data)
+        return data
+    finally:
+        db.close()
+
+
+def _retry_or_fail(job_id: int, error: str, settings: dict):
+    attempts = _attempts(job_id)
+    if attempts < int(settings["max_attempts"]):
+        _finish(job_id, "queued", None, error, float(settings["retry_delay"]) * attempts)
+    else:
+        _finish(job_id, "failed", None, error)
+
+
+class JobQueue:
+    def __init__(self):
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+        self._loop = None
+        self._requeued_at = 0.0
+
+    def notify(self):
+        if self._wakeup is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self):
+        settings = job_settings()
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await self._requeue(settings)
+        self._tasks = [
+            asyncio.create_task(self._worker(settings)) for _ in range(int(settings["workers"]))
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _requeue(self, settings: dict):
+        self._requeued_at = time.monotonic()
+        n = await asyncio.to_thread(requeue_interrupted, float(settings["lease"]))
+        if n:
+            logger.info("requeued %d interrupted parse jobs", n)
+
+    async def _settle(self, settings: dict, fn, job_id: int, *args):
+        """Record a job's outcome, retrying on database errors so the worker task survives them."""
+        for _ in range(int(settings["max_attempts"])):
+            try:
+                await asyncio.to_thread(fn, job_id, *args)
+                return
+            except Exception:
+                logger.exception("could not update parse job %s", job_id)
+                await asyncio.sleep(float(settings["poll_interval"]))
+        # left running; the lease requeues it
+
+    async def _worker(self, settings: dict):
+        poll_interval = float(settings["poll_interval"])
+        while True:
+            try:
+                claimed = await asyncio.to_thread(_claim_next)
+                if claimed is None and time.monotonic() - self._requeued_at > float(settings["lease"]) / 2:
+                    await self._requeue(settings)
+            except Exception:
+                logger.exception("could not claim a parse job")
+                await asyncio.sleep(poll_interval)
+                continue
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job_id, rt_id, payload = claimed
+            try:
+                result = await run_job(job_id, rt_id, payload)
+            except asyncio.CancelledError:
+                # shutting down: hand the job to the next worker process to start or poll
+                try:
+                    _finish(job_id, "queued", None, "interrupted")
+                except Exception:
+                    logger.exception("could not requeue parse job %s; the lease will", job_id)
+                raise
+            except Exception as e:
+                await self._settle(settings, _retry_or_fail, job_id, str(e), settings)
+                continue
+            await self._settle(settings, _finish, job_id, "done", result)
+
+
+job_queue = JobQueue()
@@ -1,26 +1,81 @@
-from fastapi import FastAPI, Depends, Form, Request, File, UploadFile
-from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from fastapi import FastAPI, Depends, Form, Query, Request, File, UploadFile
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
-import io
-import csv
-import os
-import uuid
-import pandas as pd
-from pdfminer.high_level import extract_text
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlencode
 from pydantic import BaseModel
-from .database import Base, engine, SessionLocal
-from . import models, crud
-from .openai_util import parse_text_to_fields, chat_reply
-from .report_dal import get_report_table
-
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Report Generator")
+from .config import config_store
+from .database import SessionLocal, create_schema
+from . import models, crud, export, metadata_cache
+from .openai_util import aparse_text_to_fields, achat_reply, achat_stream, close_gateway
+from .bulk_import import import_records
+from .parse_cache import parse_cache
+from .media_storage import UPLOAD_SUBDIR, store_upload, upload_store, FileTooLarge
+from .write_queue import stop_writer
+from .jobs import job_queue, enqueue_job, get_job, job_to_dict
+from . import metrics
+from .chat_history import chat_history
+from .schema_ingest import schema_ingestor, IngestError
+from .thumbnails import thumbnail_pool, thumbnail_url
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # schema setup runs here rather than at import so workers import quickly;
+    # Excel, PDF and OpenAI libraries are imported by the code that uses them
+    await run_in_threadpool(create_schema)
+    await job_queue.start()
+    # config changes made by other workers are picked up within check_interval
+    config_store.start_watching()
+    try:
+        yield
+    finally:
+        config_store.stop_watching()
+        await job_queue.stop()
+        await close_gateway()
+        schema_ingestor.shutdown()
+        thumbnail_pool.shutdown()
+        await run_in_threadpool(stop_writer)
+
+
+app = FastAPI(title="Report Generator", lifespan=lifespan)
+# uploads are served from the upload store, which need not be under static/
+app.mount(
+    f"/static/{UPLOAD_SUBDIR}",
+    StaticFiles(directory=upload_store.path(UPLOAD_SUBDIR), check_dir=False),
+    name="uploads",
+)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["thumbnail_url"] = thumbnail_url
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    token = metrics.begin_request(request.url.path)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by route template so ids in the path don't explode cardinality
+        route = request.scope.get("route")
+        metrics.end_request(
+            token,
+            request.method,
+            getattr(route, "path", "unmatched"),
+            status,
+            time.perf_counter() - start,
+        )
 
 
 def get_db():
@@ -38,9 +93,10 @@ async def index(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/report-types/new", response_class=HTMLResponse)
-async def new_report_form(request: Request):
+async def new_report_form(request: Request, import_error: str = None):
     return templates.TemplateResponse(
-        "new_report.html", {"request": request, "title": "Create Report", "active": "create"}
+        "new_report.html",
+        {"request": request, "title": "Create Report", "active": "create", "import_error": import_error},
     )
 
 
@@ -85,14 +141,12 @@ async def create_report(
             )
     else:
         contents = await file.read()
-        if file.filename.lower().endswith('.xlsx'):
-            df = pd.read_excel(io.BytesIO(contents))
-            field_list = list(df.columns)
-        elif file.filename.lower().endswith('.pdf'):
-            text = extract_text(io.BytesIO(contents))
-            field_list = [line.strip() for line in text.splitlines() if line.strip()][:10]
-        else:
-            field_list = []
+        metrics.upload_bytes.inc(len(contents), kind="schema")
+        try:
+            field_list = await schema_ingestor.derive_fields(file.filename, contents)
+        except IngestError as e:
+            query = urlencode({"import_error": str(e)})
+            return RedirectResponse(url=f"/report-types/new?{query}", status_code=302)
         question_list = [f + " を入力してください" for f in field_list]
         type_list = ["qa" for _ in field_list]
         crud.create_report_type(
@@ -101,10 +155,31 @@ async def create_report(
     return RedirectResponse(url="/", status_code=302)
 
 
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
 @app.get("/report-types/{rt_id}", response_class=HTMLResponse)
-async def show_records(request: Request, rt_id: int, db: Session = Depends(get_db)):
+async def show_records(
+    request: Request,
+    rt_id: int,
+    limit: int = PAGE_SIZE,
+    cursor: str | None = None,
+    sort: str = "id",
+    order: str = "asc",
+    field: str | None = None,
+    value: str | None = None,
+    db: Session = Depends(get_db),
+):
     rt = crud.get_report_type(db, rt_id)
-    records = crud.fetch_report_records(db, rt)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        records, next_cursor = crud.fetch_report_records_page(
+            db, rt, limit, cursor, sort, order == "desc", field or None, value
+        )
+    except ValueError:
+        records, next_cursor = crud.fetch_report_records_page(db, rt, limit)
+        sort, order, field, value = "id", "asc", None, None
     questions = crud.fetch_question_prompts(db, rt)
     type_map = {
         "qa": "テキスト",
@@ -128,6 +203,14 @@ async def show_records(request: Request, rt_id: int, db: Session = Depends(get_d
             "request": request,
             "rt": rt,
             "records": records,
+            "next_cursor": next_cursor,
+            "paging": {
+                "limit": limit,
+                "sort": sort,
+                "order": order,
+                "field": field or "",
+                "value": value or "",
+            },
             "fields_info": field_info,
             "title": rt.name,
             "active": "list",
@@ -136,14 +219,29 @@ async def show_records(request: Request, rt_id: int, db: Session = Depends(get_d
     )
 
 @app.post("/report-types/{rt_id}/upload")
-async def upload_excel(rt_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_excel(rt_id: int, request: Request, file: UploadFile = File(...), db: Session = Depends(get_db)):
     rt = crud.get_report_type(db, rt_id)
-    df = pd.read_excel(io.BytesIO(await file.read()))
     # assume first row has column names matching fields
-    for _, row in df.iterrows():
-        data = {f: str(row.get(f, "")) for f in rt.fields}
-        crud.insert_report_record(db, rt, data)
-    return RedirectResponse(url=f"/report-types/{rt_id}", status_code=302)
+    try:
+        summary = await run_in_threadpool(
+            import_records, db, rt, file.filename, file.file
+        )
+    except ValueError as e:
+        summary = {"error": str(e)}
+    metrics.upload_bytes.inc(file.size or 0, kind="import")
+    if "application/json" in request.headers.get("accept", ""):
+        return summary
+    if "error" in summary:
+        query = urlencode({"import_error": summary["error"]})
+    else:
+        query = urlencode(
+            {
+                "imported": summary["imported"],
+                "rejected": summary["rejected"],
+                "elapsed": summary["elapsed"],
+            }
+        )
+    return RedirectResponse(url=f"/report-types/{rt_id}?{query}", status_code=302)
 
   
 @app.post("/report-types/{rt_id}/records/{rec_id}/delete")
@@ -211,16 +309,73 @@ async def update_columns(rt_id: int, fields: list[str] = Form(...), db: Session
 @app.get("/report-types/{rt_id}/records/{rec_id}/excel")
 async def download_record_excel(rt_id: int, rec_id: int, db: Session = Depends(get_db)):
     rt = crud.get_report_type(db, rt_id)
-    table = get_report_table(rt.id, rt.fields)
-    sel = table.select().where(table.c.id == rec_id)
-    res = db.execute(sel).fetchone()
-    output = io.BytesIO()
-    df = pd.DataFrame([{f: res[f] for f in rt.fields}])
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False)
-    output.seek(0)
+    if not rt:
+        return {"error": "report type not found"}
+    data, _ = await run_in_threadpool(export.excel_export, rt, [rec_id], "record")
+    if data is None:
+        return {"error": "record not found"}
     headers = {"Content-Disposition": f"attachment; filename=record_{rec_id}.xlsx"}
-    return StreamingResponse(output, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers=headers)
+    return StreamingResponse(export.iter_bytes(data), media_type=export.XLSX_MEDIA_TYPE, headers=headers)
+
+
+@app.post("/report-types/{rt_id}/records/excel")
+async def download_records_excel(
+    rt_id: int,
+    record_ids: list[int] = Form(...),
+    layout: str = Form("workbook"),
+    db: Session = Depends(get_db),
+):
+    """Selected records as one workbook (a row per record) or a ZIP of per-record workbooks"""
+    rt = crud.get_report_type(db, rt_id)
+    if not rt:
+        return {"error": "report type not found"}
+    if layout not in ("workbook", "zip"):
+        return {"error": "layout must be workbook or zip"}
+    if len(record_ids) > export.MAX_BATCH_RECORDS:
+        return {"error": f"at most {export.MAX_BATCH_RECORDS} records can be exported at once"}
+    data, cached = await run_in_threadpool(export.excel_export, rt, record_ids, layout)
+    if data is None:
+        return {"error": "records not found"}
+    if layout == "zip":
+        media_type, filename = export.ZIP_MEDIA_TYPE, f"report_{rt_id}_records.zip"
+    else:
+        media_type, filename = export.XLSX_MEDIA_TYPE, f"report_{rt_id}_records.xlsx"
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Content-Length": str(len(data)),
+        "X-Export-Cache": "hit" if cached else "miss",
+    }
+    return StreamingResponse(export.iter_bytes(data), media_type=media_type, headers=headers)
+
+
+@app.get("/report-types/{rt_id}/export")
+async def export_records(
+    rt_id: int,
+    format: str = "csv",
+    record_ids: list[int] = Query(None),
+    field: str | None = None,
+    value: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """Stream all (or the selected) records as CSV or XLSX"""
+    rt = crud.get_report_type(db, rt_id)
+    if not rt:
+        return {"error": "report type not found"}
+    if format not in ("csv", "xlsx"):
+        return {"error": "format must be csv or xlsx"}
+    try:
+        batches = export.iter_record_batches(rt, record_ids, field or None, value)
+    except ValueError as e:
+        return {"error": str(e)}
+    headers = {"Content-Disposition": f"attachment; filename=report_{rt_id}.{format}"}
+    if format == "csv":
+        return StreamingResponse(
+            export.stream_csv(rt, batches), media_type=export.CSV_MEDIA_TYPE, headers=headers
+        )
+    path = await run_in_threadpool(export.write_xlsx, rt, batches)
+    return StreamingResponse(
+        export.iter_file(path), media_type=export.XLSX_MEDIA_TYPE, headers=headers
+    )
 
 
 @app.get("/users", response_class=HTMLResponse)
@@ -245,10 +400,62 @@ async def chat_page(request: Request):
 
 @app.post("/chat", response_class=HTMLResponse)
 async def chat_submit(request: Request, message: str = Form(...)):
-    reply = chat_reply(message)
+    reply = await achat_reply(message)
     return templates.TemplateResponse("chat.html", {"request": request, "title":"AIチャット", "active":"chat", "message": message, "reply": reply})
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(message: str = Form(...), conversation_id: str = Form(None)):
+    """Stream the reply as Server-Sent Events: meta, delta..., then done or error."""
+    conversation_id, history = chat_history.messages(conversation_id)
+    messages = history + [{"role": "user", "content": message}]
+
+    async def events():
+        yield _sse("meta", {"conversation_id": conversation_id})
+        parts = []
+        try:
+            async for delta in achat_stream(messages):
+                parts.append(delta)
+                yield _sse("delta", {"text": delta})
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+            return
+        chat_history.append(conversation_id, message, "".join(parts))
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/chat/reset")
+async def chat_reset(conversation_id: str = Form(...)):
+    chat_history.reset(conversation_id)
+    return {"status": "ok"}
+
+
+@app.get("/media/thumbnail")
+async def media_thumbnail(path: str, kind: str = "image"):
+    """Preview of an uploaded image/video, generated on first request"""
+    rel = await thumbnail_pool.get(path, kind)
+    if rel is None:
+        return Response(status_code=404)
+    return FileResponse(
+        upload_store.path(rel), media_type="image/jpeg", headers={"Cache-Control": "max-age=86400"}
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/settings/apis", response_class=HTMLResponse)
 async def api_list(request: Request):
     return templates.TemplateResponse("api_list.html", {"request": request, "title":"API一覧"})
@@ -276,6 +483,14 @@ class ReportRequest(BaseModel):
 
 class ParseRequest(ReportRequest):
     text: str
+    use_cache: bool = True
+    background: bool = False
+
+
+class BatchParseRequest(ReportRequest):
+    texts: list[str]
+    concurrency: int | None = None
+    use_cache: bool = True
 
 # API endpoint
 
@@ -288,27 +503,121 @@ async def api_parse(req: ParseRequest, db: Session = Depends(get_db)):
         return {"error": "report type not found"}
     if rt.mode != "smart":
         return {"error": "report type is not smart mode"}
-    data = parse_text_to_fields(req.text, rt.fields)
-    crud.insert_report_record(db, rt, data)
+    if req.background:
+        job = enqueue_job(db, rt, {"text": req.text, "use_cache": req.use_cache})
+        return {"status": "queued", "job_id": job.id}
+    data = await aparse_text_to_fields(req.text, rt.fields, rt.id, req.use_cache)
+    await crud.ainsert_report_record(db, rt, data)
     return {"status": "ok", "data": data}
 
 
-@app.post("/api/report/fields")
-async def api_report_fields(req: ReportRequest, db: Session = Depends(get_db)):
-    """Return the field list for the specified report"""
+PARSE_BATCH_CONCURRENCY = 8
+MAX_PARSE_BATCH_CONCURRENCY = 32
+
+
+def _record_values(fields: list[str], data: dict) -> dict:
+    """Align parsed data with the report fields for a batched insert."""
+    values = {}
+    for f in fields:
+        v = data.get(f)
+        if v is not None and not isinstance(v, str):
+            v = json.dumps(v, ensure_ascii=False)
+        values[f] = v
+    return values
+
+
+@app.post("/api/report/parse-batch")
+async def api_parse_batch(req: BatchParseRequest, db: Session = Depends(get_db)):
+    """Parse many free texts concurrently and store the successful ones in one transaction"""
     rt = crud.get_report_type_by_name(db, req.report_name)
     if not rt:
         return {"error": "report type not found"}
-    return {"fields": rt.fields}
+    if rt.mode != "smart":
+        return {"error": "report type is not smart mode"}
+    limit = max(1, min(req.concurrency or PARSE_BATCH_CONCURRENCY, MAX_PARSE_BATCH_CONCURRENCY))
+    semaphore = asyncio.Semaphore(limit)
+
+    async def parse_one(index: int, text: str):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                data = await aparse_text_to_fields(text, rt.fields, rt.id, req.use_cache)
+                item = {"index": index, "status": "ok", "data": data} if data else {
+                    "index": index, "status": "failed", "error": "no JSON in response"
+                }
+            except Exception as e:
+                item = {"index": index, "status": "failed", "error": str(e)}
+            item["elapsed"] = round(time.perf_counter() - start, 3)
+            return item
+
+    start = time.perf_counter()
+    items = await asyncio.gather(*[parse_one(i, t) for i, t in enumerate(req.texts)])
+    rows = [_record_values(rt.fields, item["data"]) for item in items if item["status"] == "ok"]
+    crud.bulk_insert_report_records(db, rt, rows)
+    return {
+        "status": "ok",
+        "inserted": len(rows),
+        "failed": len(items) - len(rows),
+        "elapsed": round(time.perf_counter() - start, 3),
+        "items": items,
+    }
 
 
-@app.post("/api/report/questions")
-async def api_report_questions(req: ReportRequest, db: Session = Depends(get_db)):
-    """Return the question prompts for the specified report"""
+@app.get("/api/parse-cache")
+async def api_parse_cache_stats():
+    """Return hit/miss counters of the GPT parse cache"""
+    return parse_cache.stats()
+
+
+@app.post("/api/parse-cache/purge")
+async def api_parse_cache_purge(req: ReportRequest, db: Session = Depends(get_db)):
+    """Drop cached parse results of the specified report"""
     rt = crud.get_report_type_by_name(db, req.report_name)
     if not rt:
         return {"error": "report type not found"}
-    if rt.mode == "struct":
+    removed = await run_in_threadpool(parse_cache.purge, rt.id)
+    return {"status": "ok", "removed": removed}
+
+
+def _metadata_response(request: Request, key: tuple, build):
+    """Serve a metadata payload from the response cache with ETag / If-None-Match support.
+
+    ``build(db)`` returns (report_type_id or None, payload) and only runs on
+    a cache miss.
+    """
+    cached = metadata_cache.response_cache.get(key)
+    if cached is None:
+        versions = metadata_cache.snapshot()
+        db = SessionLocal()
+        try:
+            rt_id, payload = build(db)
+        finally:
+            db.close()
+        cached = metadata_cache.response_cache.put(key, versions, rt_id, payload)
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.method == "GET" and metadata_cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _report_fields_payload(report_name: str):
+    def build(db):
+        rt = crud.get_report_type_by_name(db, report_name)
+        if not rt:
+            return None, {"error": "report type not found"}
+        return rt.id, {"fields": rt.fields}
+
+    return build
+
+
+def _report_questions_payload(report_name: str):
+    def build(db):
+        rt = crud.get_report_type_by_name(db, report_name)
+        if not rt:
+            return None, {"error": "report type not found"}
+        if rt.mode != "struct":
+            return rt.id, {"mode": "smart", "prompt": rt.prompt, "fields": rt.fields}
         questions = crud.fetch_question_prompts(db, rt)
         data = [
             {
@@ -318,15 +627,129 @@ async def api_report_questions(req: ReportRequest, db: Session = Depends(get_db)
             }
             for i, f in enumerate(rt.fields)
         ]
-        return {"mode": "struct", "questions": data}
-    else:
-        return {"mode": "smart", "prompt": rt.prompt, "fields": rt.fields}
+        return rt.id, {"mode": "struct", "questions": data}
+
+    return build
+
+
+@app.get("/api/report/fields")
+async def api_report_fields_get(request: Request, report_name: str):
+    """Return the field list for the specified report (conditional GET supported)"""
+    return _metadata_response(request, ("fields", report_name), _report_fields_payload(report_name))
+
+
+@app.post("/api/report/fields")
+async def api_report_fields(req: ReportRequest, request: Request):
+    """Return the field list for the specified report"""
+    return _metadata_response(request, ("fields", req.report_name), _report_fields_payload(req.report_name))
+
+
+@app.get("/api/report/questions")
+async def api_report_questions_get(request: Request, report_name: str):
+    """Return the question prompts for the specified report (conditional GET supported)"""
+    return _metadata_response(request, ("questions", report_name), _report_questions_payload(report_name))
+
+
+@app.post("/api/report/questions")
+async def api_report_questions(req: ReportRequest, request: Request):
+    """Return the question prompts for the specified report"""
+    return _metadata_response(request, ("questions", req.report_name), _report_questions_payload(req.report_name))
+
+
+@app.get("/api/report/records")
+async def api_report_records(
+    report_name: str,
+    limit: int = PAGE_SIZE,
+    cursor: str | None = None,
+    sort: str = "id",
+    order: str = "asc",
+    field: str | None = None,
+    value: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """Return one page of records; pass next_cursor back as cursor for the next page"""
+    rt = crud.get_report_type_by_name(db, report_name)
+    if not rt:
+        return {"error": "report type not found"}
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        records, next_cursor = crud.fetch_report_records_page(
+            db, rt, limit, cursor, sort, order == "desc", field or None, value
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+    media = {f: t for f, t in zip(rt.fields, rt.field_types or []) if t in ("image", "video")}
+    if media:
+        for r in records:
+            r["thumbnails"] = {f: thumbnail_url(r[f], t) for f, t in media.items() if r.get(f)}
+    return {"records": records, "next_cursor": next_cursor}
+
+
+CHANGES_PAGE_SIZE = 500
+MAX_CHANGES_PAGE_SIZE = 5000
+
+
+@app.get("/api/report/changes")
+async def api_report_changes(
+    report_name: str,
+    since: int = 0,
+    limit: int = CHANGES_PAGE_SIZE,
+    db: Session = Depends(get_db),
+):
+    """Records created, updated or deleted after change sequence `since`"""
+    rt = crud.get_report_type_by_name(db, report_name)
+    if not rt:
+        return {"error": "report type not found"}
+    limit = max(1, min(limit, MAX_CHANGES_PAGE_SIZE))
+    changes, next_since, has_more = crud.fetch_changes(db, rt, max(0, since), limit)
+    return {"changes": changes, "next_since": next_since, "has_more": has_more}
+
+
+@app.get("/api/report/stats")
+async def api_report_stats(report_name: str, db: Session = Depends(get_db)):
+    """Summary statistics of the specified report's records"""
+    rt = crud.get_report_type_by_name(db, report_name)
+    if not rt:
+        return {"error": "report type not found"}
+    return await run_in_threadpool(crud.fetch_report_stats, rt)
+
+
+SEARCH_PAGE_SIZE = 20
+
+
+@app.get("/api/report/search")
+async def api_report_search(
+    report_name: str,
+    q: str,
+    limit: int = SEARCH_PAGE_SIZE,
+    offset: int = 0,
+    db: Session = Depends(get_db),
+):
+    """Full-text search over the text fields of the specified report"""
+    rt = crud.get_report_type_by_name(db, report_name)
+    if not rt:
+        return {"error": "report type not found"}
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    results, next_offset = crud.search_report_records(db, rt, q, limit, max(0, offset))
+    return {"results": results, "next_offset": next_offset}
+
+
+@app.get("/api/jobs/{job_id}")
+async def api_job_status(job_id: int, db: Session = Depends(get_db)):
+    """Return the state of a background parse job"""
+    job = get_job(db, job_id)
+    if not job:
+        return {"error": "job not found"}
+    return job_to_dict(job)
+
+
+def _report_types_payload(db):
+    return None, {"reports": [rt.name for rt in crud.get_report_types(db)]}
 
 
 @app.get("/api/report-types")
-async def api_report_types(db: Session = Depends(get_db)):
-    rts = crud.get_report_types(db)
-    return {"reports": [rt.name for rt in rts]}
+async def api_report_types(request: Request):
+    return _metadata_response(request, ("report-types",), _report_types_payload)
 
   
 @app.post("/api/report/record")
@@ -344,7 +767,6 @@ async def api_create_record(request: Request, db: Session = Depends(get_db)):
 
     data: dict[str, str] = {}
     free_text = form.get("free_text")
-    os.makedirs("static/uploads", exist_ok=True)
     field_types = rt.field_types or []
     type_map = {f: field_types[i] if i < len(field_types) else "text" for i, f in enumerate(rt.fields)}
     logs.append(f"rt.fields: {rt.fields}")
@@ -359,16 +781,14 @@ async def api_create_record(request: Request, db: Session = Depends(get_db)):
         if t in ("image", "video"):
             # ✅ isinstance の代わりに hasattr を使う
             if value and hasattr(value, "filename") and value.filename:
-                contents = await value.read()
-                logs.append(f"read size: {len(contents)}")
-                if len(contents) > 100 * 1024 * 1024:
+                try:
+                    path, size = await store_upload(value)
+                except FileTooLarge:
                     logs.append("file too large")
                     return {"error": "file too large", "logs": logs}
-                ext = os.path.splitext(value.filename)[1]
-                filename = f"{uuid.uuid4().hex}{ext}"
-                with open(os.path.join("static/uploads", filename), "wb") as out:
-                    out.write(contents)
-                data[f] = f"uploads/{filename}"
+                logs.append(f"stored size: {size}")
+                thumbnail_pool.submit(path, t)
+                data[f] = path
             else:
                 logs.append("not a valid file upload")
         else:
@@ -381,15 +801,19 @@ async def api_create_record(request: Request, db: Session = Depends(get_db)):
                 logs.append("unexpected UploadFile for text field")
 
     free_fields = [name for name, t in type_map.items() if t == "free"]
+    if free_text and free_fields and form.get("background") in ("1", "true", "on"):
+        job = enqueue_job(db, rt, {"data": data, "free_text": free_text, "free_fields": free_fields})
+        logs.append(f"queued job: {job.id}")
+        return {"status": "queued", "job_id": job.id, "logs": logs}
     if free_text and free_fields:
         logs.append(f"parsing free_text into: {free_fields}")
-        parsed = parse_text_to_fields(free_text, free_fields)
+        parsed = await aparse_text_to_fields(free_text, free_fields, rt.id)
         data.update(parsed)
 
-    crud.insert_report_record(db, rt, data)
+    await crud.ainsert_report_record(db, rt, data)
     logs.append("inserted record")
     return {"status": "ok", "logs": logs}
 
-    crud.insert_report_record(db, rt, data)
+    await crud.ainsert_report_record(db, rt, data)
     logs.append("inserted record")
     return {"status": "ok", "logs": logs}
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from .config import config_store
+from .metrics import upload_bytes
+
+STATIC_DIR = "static"
+UPLOAD_SUBDIR = "uploads"
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024
+
+# defaults, overridable with the "media" section of config.json (read at startup)
+MEDIA_DEFAULTS = {
+    "backend": "local",
+    "root": STATIC_DIR,
+}
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+class UploadStore(ABC):
+    """Where uploaded files live.
+
+    Files are named ``uploads/<sha256><ext>`` and served under
+    ``/static/uploads``; previews are written next to them. ``path`` maps a
+    name to a file on the local filesystem, which thumbnails and
+    downloads read.
+    """
+
+    @abstractmethod
+    def save(self, src, ext: str, max_size: int) -> tuple[str, int]:
+        """Copy the file object ``src``; returns its name and size, raises FileTooLarge."""
+
+    @abstractmethod
+    def path(self, relpath: str) -> str:
+        ...
+
+
+class LocalUploadStore(UploadStore):
+    """Files under ``<root>/uploads``.
+
+    Names are content hashes and files appear via an atomic rename, so
+    several processes or nodes sharing ``root`` (e.g. a network volume)
+    can write to it concurrently.
+    """
+
+    def __init__(self, root: str = STATIC_DIR):
+        self.root = root
+
+    def path(self, relpath: str) -> str:
+        return os.path.join(self.root, relpath)
+
+    def save(self, src, ext: str, max_size: int) -> tuple[str, int]:
+        upload_dir = self.path(UPLOAD_SUBDIR)
+        os.makedirs(upload_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=upload_dir, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileTooLarge()
+                    digest.update(chunk)
+                    out.write(chunk)
+            filename = f"{digest.hexdigest()}{ext}"
+            dest = os.path.join(upload_dir, filename)
+            if os.path.exists(dest):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, dest)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return f"{UPLOAD_SUBDIR}/{filename}", size
+
+
+# "backend" names a class here; the section's other keys are passed to it
+UPLOAD_STORES = {"local": LocalUploadStore}
+
+
+def media_settings() -> dict:
+    return config_store.settings("media", MEDIA_DEFAULTS)
+
+
+def _configured_store() -> UploadStore:
+    options = media_settings()
+    return UPLOAD_STORES[options.pop("backend")](**options)
+
+
+upload_store = _configured_store()
+
+
+async def store_upload(upload: UploadFile, max_size: int | None = None) -> tuple[str, int]:
+    """Copy an uploaded file to the upload store in chunks under its SHA-256 content hash.
+
+    Identical content is stored once. Returns the file's name in the
+    upload store and the size in bytes. The limit applies once Starlette
+    has received (and spooled) the request body: a file larger than
+    ``max_size`` (default MAX_UPLOAD_SIZE) raises FileTooLarge without
+    being copied when its size is known, or as soon as the copy exceeds
+    it otherwise. The copy runs in a worker thread.
+    """
+    max_size = max_size or MAX_UPLOAD_SIZE
+    if upload.size is not None and upload.size > max_size:
+        raise FileTooLarge()
+    ext = os.path.splitext(upload.filename)[1].lower()
+    await upload.seek(0)
+    relpath, size = await run_in_threadpool(upload_store.save, upload.file, ext, max_size)
+    upload_bytes.inc(size, kind="media")
+    return relpath, size
@@ -0,0 +1,84 @@
+"""Version counters for report metadata and a cache of the metadata API responses.
+
+``crud`` bumps a report type's version whenever its fields, field types,
+questions or prompt change, and the catalog version whenever report types
+are created or deleted. Cached responses remember the versions they were
+built from and are served, or answered with 304 Not Modified, without
+building them again until one of those versions moves. ETags are a hash
+of the response body, so they stay valid across restarts.
+
+The counters are kept in ``shared_versions``, so a change made through
+another worker process invalidates this process's responses within
+``shared_versions.CHECK_INTERVAL`` seconds.
+"""
+import hashlib
+import json
+from . import shared_versions
+
+# bounds the cache when clients ask for many unknown report names
+MAX_ENTRIES = 10000
+CATALOG = "catalog"
+
+
+def _type_scope(report_type_id: int) -> str:
+    return f"report_type:{report_type_id}"
+
+
+def catalog_version() -> int:
+    return shared_versions.version(CATALOG)
+
+
+def type_version(report_type_id: int) -> int:
+    return shared_versions.version(_type_scope(report_type_id))
+
+
+def bump(report_type_id: int | None = None, catalog: bool = False):
+    """Mark metadata as changed; call after the change has been committed."""
+    scopes = [CATALOG] if catalog else []
+    if report_type_id is not None:
+        scopes.append(_type_scope(report_type_id))
+    shared_versions.bump(*scopes)
+
+
+def snapshot() -> dict[str, int]:
+    """Versions to record before building a response, so a concurrent bump invalidates it."""
+    return shared_versions.snapshot()
+
+
+class ResponseCache:
+    def __init__(self):
+        # key -> (catalog version, report type id or None, type version, etag, body)
+        self._entries: dict[tuple, tuple] = {}
+
+    def get(self, key: tuple) -> tuple[str, bytes] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        catalog, rt_id, version, etag, body = entry
+        if catalog != catalog_version() or (rt_id is not None and version != type_version(rt_id)):
+            return None
+        return etag, body
+
+    def put(self, key: tuple, versions: dict[str, int], rt_id: int | None, payload: dict) -> tuple[str, bytes]:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if len(self._entries) >= MAX_ENTRIES:
+            self._entries.clear()
+        version = versions.get(_type_scope(rt_id), 0) if rt_id is not None else 0
+        self._entries[key] = (versions.get(CATALOG, 0), rt_id, version, etag, body)
+        return etag, body
+
+    def clear(self):
+        self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag in candidates
@@ -0,0 +1,204 @@
+"""Minimal in-process metrics rendered in the Prometheus text format.
+
+Request timing comes from the HTTP middleware in ``main``, database timing
+from SQLAlchemy cursor events on the engine, and LLM and upload counters
+from the code paths that do the work. Per-request database totals are
+accumulated in a context variable; queries slower than
+``metrics.slow_query_ms`` in config.json are logged with their route.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from sqlalchemy import event
+from .config import config_store
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labelnames = name, help, labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help, labels, buckets
+        # key -> [bucket counts..., sum, count]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if idx < len(self.buckets):
+                data[idx] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, data in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, data):
+                cumulative += n
+                le = _labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {data[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {data[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {data[-1]}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+db_query_duration = Histogram("db_query_duration_seconds", "Duration of individual SQL statements.")
+db_queries_per_request = Histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request.", ("route",), COUNT_BUCKETS
+)
+db_time_per_request = Histogram(
+    "db_time_per_request_seconds", "Total SQL time per HTTP request.", ("route",)
+)
+llm_request_duration = Histogram(
+    "llm_request_duration_seconds", "Latency of LLM calls.", ("operation",)
+)
+llm_time_to_first_token = Histogram(
+    "llm_time_to_first_token_seconds", "Time until the first streamed token arrives.", ("operation",)
+)
+llm_requests = Counter("llm_requests_total", "LLM calls by outcome.", ("operation", "outcome"))
+llm_tokens = Counter("llm_tokens_total", "Tokens reported by the LLM API.", ("operation", "kind"))
+upload_bytes = Counter("upload_bytes_total", "Bytes received in uploads.", ("kind",))
+
+REGISTRY = [
+    http_request_duration,
+    db_query_duration,
+    db_queries_per_request,
+    db_time_per_request,
+    llm_request_duration,
+    llm_time_to_first_token,
+    llm_requests,
+    llm_tokens,
+    upload_bytes,
+]
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# per-request database statistics; the dict is shared with worker threads
+_request_stats: contextvars.ContextVar[dict | None] = contextvars.ContextVar("request_stats", default=None)
+
+
+def slow_query_threshold() -> float | None:
+    ms = config_store.section("metrics").get("slow_query_ms")
+    return float(ms) / 1000 if ms else None
+
+
+def begin_request(path: str) -> contextvars.Token:
+    return _request_stats.set({"path": path, "queries": 0, "db_time": 0.0})
+
+
+def end_request(token: contextvars.Token, method: str, route: str, status: int, elapsed: float):
+    stats = _request_stats.get()
+    _request_stats.reset(token)
+    http_request_duration.observe(elapsed, method=method, route=route, status=str(status))
+    if stats is not None:
+        db_queries_per_request.observe(stats["queries"], route=route)
+        db_time_per_request.observe(stats["db_time"], route=route)
+
+
+class LLMTimer:
+    """Context manager recording latency and outcome of one LLM call."""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def usage(self, usage: dict | None):
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage and usage.get(kind):
+                llm_tokens.inc(usage[kind], operation=self.operation, kind=kind.split("_")[0])
+
+    def __exit__(self, exc_type, exc, tb):
+        llm_request_duration.observe(time.perf_counter() - self.start, operation=self.operation)
+        if exc_type is None:
+            outcome = "ok"
+        elif issubclass(exc_type, (GeneratorExit, asyncio.CancelledError)):
+            # the client went away before the (streamed) reply finished
+            outcome = "cancelled"
+        else:
+            outcome = "error"
+        llm_requests.inc(operation=self.operation, outcome=outcome)
+        return False
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    db_query_duration.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats["queries"] += 1
+        stats["db_time"] += elapsed
+    threshold = slow_query_threshold()
+    if threshold is not None and elapsed >= threshold:
+        logger.warning(
+            "slow query %.1fms%s: %s",
+            elapsed * 1000,
+            f" ({stats['path']})" if stats else "",
+            " ".join(statement.split())[:500],
+        )
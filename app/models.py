@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON
+from sqlalchemy import Boolean, Column, Float, Integer, String, JSON, text
 from .database import Base
 
 class ReportType(Base):
@@ -9,3 +9,61 @@ class ReportType(Base):
     prompt = Column(String, nullable=True)  # used only in smart mode
     fields = Column(JSON)  # list of field names in order
     field_types = Column(JSON)  # list of input types aligned with fields
+
+
+class ParseCacheEntry(Base):
+    __tablename__ = "parse_cache"
+    key = Column(String, primary_key=True)
+    report_type_id = Column(Integer, index=True, nullable=True)
+    result = Column(JSON)
+    created_at = Column(Float)
+    last_used = Column(Float, index=True)
+
+
+class ParseJob(Base):
+    __tablename__ = "parse_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    report_type_id = Column(Integer, index=True)
+    status = Column(String, index=True, default="queued")  # queued, running, done, failed
+    payload = Column(JSON)  # {"text": ...} or {"data": ..., "free_text": ..., "free_fields": [...]}
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    run_after = Column(Float, default=0.0)
+    created_at = Column(Float)
+    updated_at = Column(Float)
+
+
+# Tables of the "json" record storage backend (see record_store.py)
+_NOW = text("(strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))")
+
+
+class ReportRecord(Base):
+    __tablename__ = "report_records"
+    id = Column(Integer, primary_key=True)
+    report_type_id = Column(Integer, index=True, nullable=False)
+    payload = Column(String, nullable=False)  # JSON object keyed by ReportFieldKey.key
+    created_at = Column(String, server_default=_NOW)
+    updated_at = Column(String, server_default=_NOW)
+
+
+class ReportFieldKey(Base):
+    """Stable payload key of a field; renaming a field only changes ``name``."""
+    __tablename__ = "report_field_keys"
+    report_type_id = Column(Integer, primary_key=True)
+    key = Column(String, primary_key=True)
+    name = Column(String, nullable=False)
+    searchable = Column(Boolean, default=True)
+
+
+class ReportQuestions(Base):
+    __tablename__ = "report_questions"
+    report_type_id = Column(Integer, primary_key=True)
+    payload = Column(String, nullable=False)  # JSON object keyed by ReportFieldKey.key
+
+
+class SharedVersion(Base):
+    """Change counter read by every worker process; see ``shared_versions``."""
+    __tablename__ = "shared_versions"
+    scope = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
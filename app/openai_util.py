@@ -1,39 +1,287 @@
-import os
-import openai
-from .config import load_openai_config
+import asyncio
+import json
+import random
+import time
+from functools import lru_cache
+import httpx
+from .config import config_store, get_openai_settings
+from .parse_cache import parse_cache, make_key
+from .metrics import LLMTimer, llm_time_to_first_token
+from .extraction import count_tokens, extraction_settings, merge_results, split_text
 
 MODEL = "gpt-4-1106-preview"
+# bump when build_parse_prompt changes so cached results are not reused
+PROMPT_VERSION = 2
+DEFAULT_API_BASE = "https://api.openai.com/v1"
 
+# defaults for the async gateway, overridable with the "llm" section of config.json
+LLM_DEFAULTS = {
+    "max_concurrency": 8,
+    "max_connections": 20,
+    "timeout": 60.0,
+    "max_retries": 3,
+    "backoff_base": 0.5,
+    "backoff_max": 20.0,
+}
+RETRY_STATUS = {429, 500, 502, 503, 504}
 
-def _setup_openai():
-    cfg = load_openai_config()
-    openai.api_key = cfg.get("key") or os.getenv("OPENAI_API_KEY")
-    endpoint = cfg.get("endpoint") or os.getenv("OPENAI_ENDPOINT")
-    if endpoint:
-        openai.api_base = endpoint
-    if not openai.api_key:
-        raise RuntimeError("OpenAI API key not set")
 
-
-def parse_text_to_fields(text: str, fields: list[str]) -> dict:
-    """Call OpenAI to parse text into fields"""
-    _setup_openai()
+@lru_cache(maxsize=256)
+def _prompt_suffix(fields: tuple[str, ...], partial: bool = False) -> str:
+    """Everything after the input text; depends only on the report type's fields."""
     field_lines = ",\n".join([f'    "{f}": {{{f}}}' for f in fields])
     example_lines = ",\n".join([f'    "{f}": "サンプル"' for f in fields])
-    prompt = (
-        f"{text}\nを下記の通りにレポート形式に直してください。Jsonで出力し、コロンは半角「:」を使用し、絶対に変更しないでください。指定された順序を維持してください。\n\n---\n{{\n{field_lines}\n}}\n---\n\n**記載例**\n{{\n{example_lines}\n}}"
+    note = "この文章は長い文書の一部です。記載のない項目は空文字\"\"にしてください。" if partial else ""
+    return (
+        f"\nを下記の通りにレポート形式に直してください。{note}Jsonで出力し、コロンは半角「:」を使用し、絶対に変更しないでください。指定された順序を維持してください。\n\n---\n{{\n{field_lines}\n}}\n---\n\n**記載例**\n{{\n{example_lines}\n}}"
     )
-    messages = [{"role": "user", "content": prompt}]
-    response = openai.ChatCompletion.create(model=MODEL, messages=messages)
-    content = response.choices[0].message.content
+
+
+def build_parse_prompt(text: str, fields: list[str], partial: bool = False) -> str:
+    return text + _prompt_suffix(tuple(fields), partial)
+
+
+def _split_for_extraction(text: str, fields: list[str]) -> list[str] | None:
+    """Chunks of a text too long for one call, or None to parse it in one pass."""
+    cfg = extraction_settings()
+    overhead = count_tokens(_prompt_suffix(tuple(fields), True))
+    if count_tokens(text) + overhead <= int(cfg["single_pass_tokens"]):
+        return None
+    chunk_tokens = max(int(cfg["chunk_tokens"]) - overhead, 1)
+    overlap = int(cfg["overlap_tokens"])
+    # grow the chunks rather than exceed max_chunks calls per text
+    max_chunks = max(int(cfg["max_chunks"]), 1)
+    chunk_tokens = max(chunk_tokens, count_tokens(text) // max_chunks + overlap + 1)
+    chunks = split_text(text, chunk_tokens, overlap)
+    while len(chunks) > max_chunks:
+        chunk_tokens += chunk_tokens // 10 + 1
+        chunks = split_text(text, chunk_tokens, overlap)
+    return chunks if len(chunks) > 1 else None
+
+
+def _parse_json_content(content: str) -> dict:
     try:
-        import json
-        return json.loads(content)
+        data = json.loads(content)
     except Exception:
         return {}
+    return data if isinstance(data, dict) else {}
+
+
+class LLMGateway:
+    """Async chat completion client with a pooled HTTP connection and bounded concurrency.
+
+    ``transport`` is passed to ``httpx.AsyncClient`` so a fake server
+    (e.g. ``httpx.ASGITransport`` or ``httpx.MockTransport``) can replace
+    the real endpoint.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None, **options):
+        cfg = config_store.settings("llm", LLM_DEFAULTS)
+        cfg.update(options)
+        self._options = options
+        self.max_concurrency = int(cfg["max_concurrency"])
+        self.timeout = float(cfg["timeout"])
+        self.max_retries = int(cfg["max_retries"])
+        self.backoff_base = float(cfg["backoff_base"])
+        self.backoff_max = float(cfg["backoff_max"])
+        self._limits = httpx.Limits(
+            max_connections=int(cfg["max_connections"]),
+            max_keepalive_connections=int(cfg["max_connections"]),
+        )
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop = None
+
+    def _ensure_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # pools and semaphores are bound to the loop that created them
+            self._client = httpx.AsyncClient(
+                limits=self._limits, transport=self._transport, timeout=self.timeout
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    def _backoff(self, attempt: int, response: httpx.Response | None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        # full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def chat_completion(self, messages: list[dict], model: str = MODEL, timeout: float | None = None) -> dict:
+        """POST a chat completion request and return the decoded JSON response."""
+        cfg = get_openai_settings()
+        if not cfg.key:
+            raise RuntimeError("OpenAI API key not set")
+        url = (cfg.endpoint or DEFAULT_API_BASE).rstrip("/") + "/chat/completions"
+        headers = {"Authorization": f"Bearer {cfg.key}", "api-key": cfg.key}
+        payload = {"model": model, "messages": messages}
+        client = self._ensure_client()
+        attempt = 0
+        while True:
+            response = None
+            try:
+                async with self._semaphore:
+                    response = await client.post(
+                        url, json=payload, headers=headers, timeout=timeout or self.timeout
+                    )
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                error = RuntimeError(f"OpenAI request failed with status {response.status_code}")
+            except httpx.TransportError as e:
+                error = e
+            if attempt >= self.max_retries:
+                raise error
+            await asyncio.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    async def stream_chat_completion(self, messages: list[dict], model: str = MODEL, timeout: float | None = None):
+        """Yield reply text deltas of a streamed (SSE) chat completion.
+
+        Retries like chat_completion, but only until the first delta has
+        been yielded; errors after that are raised to the caller.
+        """
+        cfg = get_openai_settings()
+        if not cfg.key:
+            raise RuntimeError("OpenAI API key not set")
+        url = (cfg.endpoint or DEFAULT_API_BASE).rstrip("/") + "/chat/completions"
+        headers = {"Authorization": f"Bearer {cfg.key}", "api-key": cfg.key}
+        payload = {"model": model, "messages": messages, "stream": True}
+        client = self._ensure_client()
+        attempt = 0
+        started = False
+        while True:
+            response = None
+            try:
+                async with self._semaphore:
+                    async with client.stream(
+                        "POST", url, json=payload, headers=headers, timeout=timeout or self.timeout
+                    ) as response:
+                        if response.status_code not in RETRY_STATUS:
+                            response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    return
+                                # Azure sends chunks without choices (e.g. content filter results)
+                                for choice in json.loads(data).get("choices") or []:
+                                    delta = (choice.get("delta") or {}).get("content")
+                                    if delta:
+                                        started = True
+                                        yield delta
+                            return
+                error = RuntimeError(f"OpenAI request failed with status {response.status_code}")
+            except httpx.TransportError as e:
+                if started:
+                    raise
+                error = e
+            if attempt >= self.max_retries:
+                raise error
+            await asyncio.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_gateway: LLMGateway | None = None
+_gateway_stale = False
+# replaced gateways, closed at shutdown rather than under requests still using them
+_retired: list[LLMGateway] = []
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway, _gateway_stale
+    if _gateway is None:
+        _gateway = LLMGateway()
+    elif _gateway_stale:
+        _retired.append(_gateway)
+        _gateway = LLMGateway(transport=_gateway._transport, **_gateway._options)
+    _gateway_stale = False
+    return _gateway
+
+
+def _settings_changed(sections: set[str]):
+    """Config listener: rebuild the gateway with the new "llm" limits on next use."""
+    global _gateway_stale
+    if "llm" in sections:
+        _gateway_stale = True
+
+
+config_store.subscribe(_settings_changed)
+
+
+def configure_gateway(transport: httpx.AsyncBaseTransport | None = None, **options) -> LLMGateway:
+    """Replace the shared gateway, e.g. to point it at a fake transport."""
+    global _gateway
+    _gateway = LLMGateway(transport=transport, **options)
+    return _gateway
+
+
+async def close_gateway():
+    for gateway in _retired:
+        await gateway.aclose()
+    _retired.clear()
+    if _gateway is not None:
+        await _gateway.aclose()
+
+
+async def _acomplete_fields(prompt: str) -> dict:
+    messages = [{"role": "user", "content": prompt}]
+    with LLMTimer("parse") as timer:
+        response = await get_gateway().chat_completion(messages)
+        timer.usage(response.get("usage"))
+    return _parse_json_content(response["choices"][0]["message"]["content"])
+
+
+async def aparse_text_to_fields(text: str, fields: list[str], report_type_id: int | None = None, use_cache: bool = True) -> dict:
+    """Call the LLM to parse text into fields; long texts are split and parsed chunk by chunk"""
+    use_cache = use_cache and parse_cache.enabled
+    if use_cache:
+        key = make_key(text, fields, MODEL, PROMPT_VERSION)
+        cached = await parse_cache.aget(key)
+        if cached is not None:
+            return cached
+    chunks = _split_for_extraction(text, fields)
+    if chunks is None:
+        data = await _acomplete_fields(build_parse_prompt(text, fields))
+    else:
+        # the gateway's semaphore bounds how many chunks are in flight
+        results = await asyncio.gather(
+            *(_acomplete_fields(build_parse_prompt(c, fields, partial=True)) for c in chunks)
+        )
+        data = merge_results(fields, list(results))
+    if use_cache:
+        await parse_cache.aput(key, data, report_type_id)
+    return data
+
+
+async def achat_reply(message: str) -> str:
+    with LLMTimer("chat") as timer:
+        response = await get_gateway().chat_completion([{"role": "user", "content": message}])
+        timer.usage(response.get("usage"))
+    return response["choices"][0]["message"]["content"]
 
 
-def chat_reply(message: str) -> str:
-    _setup_openai()
-    response = openai.ChatCompletion.create(model=MODEL, messages=[{"role": "user", "content": message}])
-    return response.choices[0].message.content
+async def achat_stream(messages: list[dict]):
+    """Yield the reply to a conversation chunk by chunk, recording time to first token."""
+    start = time.perf_counter()
+    first = True
+    with LLMTimer("chat_stream"):
+        async for delta in get_gateway().stream_chat_completion(messages):
+            if first:
+                llm_time_to_first_token.observe(time.perf_counter() - start, operation="chat_stream")
+                first = False
+            yield delta
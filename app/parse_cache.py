@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from . import models, shared_versions
+from .config import config_store
+from .database import SessionLocal
+
+# defaults, overridable with the "parse_cache" section of config.json
+CACHE_DEFAULTS = {
+    "enabled": True,
+    "memory_entries": 1024,
+    "max_entries": 100000,
+    "ttl": 30 * 24 * 3600,
+}
+PURGE_SCOPE = "parse_cache"
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def make_key(text: str, fields: list[str], model: str, prompt_version: int) -> str:
+    raw = json.dumps([normalize_text(text), list(fields), model, prompt_version], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ParseCache:
+    """Two-tier cache of GPT field extraction results.
+
+    An in-process LRU sits in front of the ``parse_cache`` SQLite table.
+    Entries expire after ``ttl`` seconds; the table is trimmed to
+    ``max_entries`` by least recent use. Purges are announced through
+    ``shared_versions`` so other workers drop their in-process entries too.
+    """
+
+    def __init__(self, **options):
+        cfg = config_store.settings("parse_cache", CACHE_DEFAULTS)
+        cfg.update(options)
+        self.enabled = bool(cfg["enabled"])
+        self.memory_entries = int(cfg["memory_entries"])
+        self.max_entries = int(cfg["max_entries"])
+        self.ttl = float(cfg["ttl"])
+        self._memory: OrderedDict[str, tuple[dict, int | None, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        # purge scope -> version already applied to the memory tier
+        self._purges: dict[str, int] | None = None
+        self.counters = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def _remember(self, key: str, result: dict, report_type_id: int | None, created_at: float):
+        with self._lock:
+            self._memory[key] = (result, report_type_id, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _drop_purged(self):
+        """Drop memory entries of report types purged since the last check, by any worker."""
+        versions = {k: v for k, v in shared_versions.snapshot().items() if k.startswith(PURGE_SCOPE)}
+        with self._lock:
+            if self._purges is None:
+                self._purges = versions
+                return
+            for scope, version in versions.items():
+                if version == self._purges.get(scope, 0):
+                    continue
+                self._purges[scope] = version
+                if scope == PURGE_SCOPE:
+                    self._memory.clear()
+                    continue
+                report_type_id = int(scope.rsplit(":", 1)[1])
+                for key in [k for k, v in self._memory.items() if v[1] == report_type_id]:
+                    del self._memory[key]
+
+    def get_memory(self, key: str) -> dict | None:
+        self._drop_purged()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[2] + self.ttl < time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            return dict(entry[0])
+
+    def get_stored(self, key: str) -> dict | None:
+        now = time.time()
+        db = SessionLocal()
+        try:
+            entry = db.get(models.ParseCacheEntry, key)
+            if entry is None or entry.created_at + self.ttl < now:
+                if entry is not None:
+                    db.delete(entry)
+                    db.commit()
+                self._count("misses")
+                return None
+            entry.last_used = now
+            db.commit()
+            result, report_type_id, created_at = entry.result, entry.report_type_id, entry.created_at
+        finally:
+            db.close()
+        self._remember(key, result, report_type_id, created_at)
+        self._count("db_hits")
+        return result
+
+    def get(self, key: str) -> dict | None:
+        result = self.get_memory(key)
+        if result is None:
+            result = self.get_stored(key)
+        return result
+
+    async def aget(self, key: str) -> dict | None:
+        result = self.get_memory(key)
+        if result is None:
+            result = await asyncio.to_thread(self.get_stored, key)
+        return result
+
+    def put(self, key: str, result: dict, report_type_id: int | None = None):
+        """Store a successfully parsed result."""
+        if not result or not isinstance(result, dict):
+            return
+        now = time.time()
+        self._remember(key, result, report_type_id, now)
+        db = SessionLocal()
+        try:
+            db.merge(
+                models.ParseCacheEntry(
+                    key=key, report_type_id=report_type_id, result=result, created_at=now, last_used=now
+                )
+            )
+            db.commit()
+            excess = db.query(models.ParseCacheEntry).count() - self.max_entries
+            if excess > 0:
+                old = [
+                    k
+                    for (k,) in db.query(models.ParseCacheEntry.key)
+                    .order_by(models.ParseCacheEntry.last_used)
+                    .limit(excess)
+                ]
+                db.query(models.ParseCacheEntry).filter(
+                    models.ParseCacheEntry.key.in_(old)
+                ).delete(synchronize_session=False)
+                db.commit()
+                self._count("evictions", excess)
+        finally:
+            db.close()
+        self._count("stores")
+
+    async def aput(self, key: str, result: dict, report_type_id: int | None = None):
+        await asyncio.to_thread(self.put, key, result, report_type_id)
+
+    def purge(self, report_type_id: int | None = None) -> int:
+        """Remove the entries of one report type, or everything when no id is given."""
+        with self._lock:
+            for key in [
+                k for k, v in self._memory.items() if report_type_id is None or v[1] == report_type_id
+            ]:
+                del self._memory[key]
+        db = SessionLocal()
+        try:
+            q = db.query(models.ParseCacheEntry)
+            if report_type_id is not None:
+                q = q.filter(models.ParseCacheEntry.report_type_id == report_type_id)
+            removed = q.delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        shared_versions.bump(PURGE_SCOPE if report_type_id is None else f"{PURGE_SCOPE}:{report_type_id}")
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self.counters)
+            data["memory_entries"] = len(self._memory)
+        lookups = data["memory_hits"] + data["db_hits"] + data["misses"]
+        data["hit_rate"] = round((data["memory_hits"] + data["db_hits"]) / lookups, 4) if lookups else 0.0
+        return data
+
+
+parse_cache = ParseCache()
@@ -0,0 +1,26 @@
+"""Rebuild the full-text search index of existing reports.
+
+Usage: python -m app.rebuild_search [report_name ...]
+"""
+import sys
+from .database import Base, engine, SessionLocal
+from . import crud
+
+
+def main(names: list[str]):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rts = [crud.get_report_type_by_name(db, n) for n in names] if names else crud.get_report_types(db)
+        for name, rt in zip(names or [rt.name for rt in rts], rts):
+            if rt is None:
+                print(f"{name}: report type not found")
+                continue
+            crud.rebuild_search_index(rt)
+            print(f"{rt.name}: indexed {', '.join(crud.search_fields(rt)) or '(no text fields)'}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,495 @@
+"""Storage backends for report records.
+
+``crud``, ``export`` and the group-commit writer reach records only
+through a ``RecordStore``:
+
+- ``tables`` (default): one ``report_{id}`` table per report type (and
+  ``report_{id}_q`` for questions) with a column per field, see
+  ``report_dal``. Renaming a field is an ``ALTER TABLE``.
+- ``json``: all records in ``report_records`` with the field values in a
+  JSON ``payload`` plus the report type id and timestamps. Payload keys
+  are stable per-field keys (``f1``, ``f2``, ...) mapped to field names in
+  ``report_field_keys``, so renaming a field only updates that mapping.
+  Filtering or sorting on a field creates an index on
+  ``(report_type_id, json_extract(payload, '$.<key>'), id)``, shared by
+  every report type that has a field with that key. The change log and
+  full-text index are shared tables kept in sync by triggers.
+
+The ``storage`` section of config.json (``{"backend": "json"}``) picks the
+backend for report types created from then on; existing report types keep
+the storage they were created with.
+
+Reads go through ``records(rt)``, a selectable with an ``id`` column and
+one column per field name for either backend, so queries are built the
+same way for both.
+"""
+import json
+import threading
+from abc import ABC, abstractmethod
+from sqlalchemy import and_, column, func, literal_column, null, select, table as sql_table, text
+from .config import config_store
+from .database import engine
+from .models import ReportFieldKey, ReportQuestions, ReportRecord
+from . import report_dal
+
+# defaults, overridable with the "storage" section of config.json
+STORAGE_DEFAULTS = {"backend": "tables"}
+SEARCH_FIELD_TYPES = ("qa", "free")
+
+
+def storage_settings() -> dict:
+    return config_store.settings("storage", STORAGE_DEFAULTS)
+
+
+def search_fields(fields: list[str], types: list[str] | None) -> list[str]:
+    """Fields covered by the full-text index (text answers, not media)."""
+    types = types or []
+    return [f for i, f in enumerate(fields) if (types[i] if i < len(types) else "qa") in SEARCH_FIELD_TYPES]
+
+
+def check_fields(rows: list[dict], fields):
+    """Raise ValueError for row keys that are not among ``fields``."""
+    known = set(fields)
+    for row in rows:
+        unknown = set(row) - known
+        if unknown:
+            # executemany would silently drop them; a direct insert raises
+            raise ValueError(f"unknown columns: {sorted(unknown)}")
+
+
+class RecordStore(ABC):
+    """Operations on the records and question prompts of report types.
+
+    ``conn`` arguments accept a Session or a Connection; callers commit.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def create(self, rt):
+        """Set up storage for a newly created report type."""
+
+    @abstractmethod
+    def drop(self, report_type_id: int):
+        ...
+
+    @abstractmethod
+    def records(self, rt):
+        """Selectable with ``id`` and one column per field of ``rt``."""
+
+    @abstractmethod
+    def ensure_index(self, rt, field: str):
+        """Index ``field`` for filtering and keyset paging."""
+
+    @abstractmethod
+    def insert_rows(self, conn, report_type_id: int, fields: list[str], rows: list[dict]):
+        ...
+
+    @abstractmethod
+    def update(self, conn, rt, record_id: int, data: dict):
+        ...
+
+    @abstractmethod
+    def delete(self, conn, rt, ids: list[int]):
+        ...
+
+    @abstractmethod
+    def rename_fields(self, rt, new_fields: list[str]) -> bool:
+        """Rename ``rt.fields`` pairwise to ``new_fields``; returns whether anything changed."""
+
+    @abstractmethod
+    def fields_changed(self, rt, renamed: bool):
+        """Called after the new field list of ``rt`` has been committed."""
+
+    @abstractmethod
+    def change_log(self, rt):
+        """Selectable with seq, record_id, deleted, created_at and updated_at of ``rt``'s records."""
+
+    @abstractmethod
+    def has_search_index(self, rt) -> bool:
+        ...
+
+    @abstractmethod
+    def rebuild_search_index(self, rt):
+        ...
+
+    @abstractmethod
+    def search(self, conn, rt, match: str, marks: tuple[str, str], limit: int, offset: int) -> list[dict]:
+        """Rows matching the FTS5 query ``match`` with ``snippet`` and ``rank`` (bm25), best first."""
+
+    @abstractmethod
+    def get_questions(self, conn, rt) -> dict | None:
+        ...
+
+    @abstractmethod
+    def set_questions(self, conn, rt, data: dict):
+        ...
+
+
+class TableStore(RecordStore):
+    name = "tables"
+
+    def create(self, rt):
+        report_dal.get_report_table(rt.id, rt.fields)
+        report_dal.create_search_index(rt.id, search_fields(rt.fields, rt.field_types))
+        if rt.mode == "struct":
+            report_dal.get_question_table(rt.id, rt.fields)
+
+    def drop(self, report_type_id: int):
+        report_dal.drop_report_table(report_type_id)
+        report_dal.drop_question_table(report_type_id)
+
+    def records(self, rt):
+        return report_dal.get_report_table(rt.id, rt.fields)
+
+    def ensure_index(self, rt, field: str):
+        report_dal.ensure_field_index(rt.id, field)
+
+    def insert_rows(self, conn, report_type_id: int, fields: list[str], rows: list[dict]):
+        check_fields(rows, fields)
+        conn.execute(report_dal.get_report_table(report_type_id, fields).insert(), rows)
+
+    def update(self, conn, rt, record_id: int, data: dict):
+        table = self.records(rt)
+        conn.execute(table.update().where(table.c.id == record_id).values(**data))
+
+    def delete(self, conn, rt, ids: list[int]):
+        report_dal.delete_records(rt.id, ids)
+
+    def rename_fields(self, rt, new_fields: list[str]) -> bool:
+        renamed = False
+        for old, new in zip(rt.fields, new_fields):
+            if old != new:
+                report_dal.rename_column(rt.id, old, new)
+                if rt.mode == "struct":
+                    report_dal.rename_question_column(rt.id, old, new)
+                renamed = True
+        report_dal.invalidate_report_tables(rt.id)
+        return renamed
+
+    def fields_changed(self, rt, renamed: bool):
+        # renaming a column dropped the search index
+        if renamed:
+            self.rebuild_search_index(rt)
+
+    def change_log(self, rt):
+        report_dal.get_report_table(rt.id, rt.fields)  # creates the log if missing
+        return sql_table(
+            report_dal.change_table_name(rt.id),
+            column("seq"), column("record_id"), column("deleted"), column("created_at"), column("updated_at"),
+        )
+
+    def has_search_index(self, rt) -> bool:
+        return report_dal.has_search_index(rt.id)
+
+    def rebuild_search_index(self, rt):
+        report_dal.get_report_table(rt.id, rt.fields)
+        report_dal.create_search_index(rt.id, search_fields(rt.fields, rt.field_types))
+
+    def search(self, conn, rt, match: str, marks: tuple[str, str], limit: int, offset: int) -> list[dict]:
+        tbl = f'"report_{rt.id}"'
+        fts = f'"{report_dal.search_table_name(rt.id)}"'
+        cols = ", ".join("r." + '"' + f.replace('"', '""') + '"' for f in rt.fields)
+        sql = (
+            f"SELECT r.id, {cols}, snippet({fts}, -1, :ms, :me, '…', 16) AS snippet, "
+            f"bm25({fts}) AS rank FROM {fts} JOIN {tbl} r ON r.id = {fts}.rowid "
+            f"WHERE {fts} MATCH :q ORDER BY rank LIMIT :limit OFFSET :offset"
+        )
+        params = {"q": match, "ms": marks[0], "me": marks[1], "limit": limit, "offset": offset}
+        return [dict(r) for r in conn.execute(text(sql), params)]
+
+    def get_questions(self, conn, rt) -> dict | None:
+        table = report_dal.get_question_table(rt.id, rt.fields)
+        res = conn.execute(table.select()).fetchone()
+        if not res:
+            return None
+        return {f: res[f] for f in rt.fields}
+
+    def set_questions(self, conn, rt, data: dict):
+        table = report_dal.get_question_table(rt.id, rt.fields)
+        existing = conn.execute(table.select()).fetchone()
+        if existing:
+            conn.execute(table.update().where(table.c.id == existing["id"]).values(**data))
+        else:
+            conn.execute(table.insert().values(**data))
+
+
+_records = ReportRecord.__table__
+_field_keys = ReportFieldKey.__table__
+_questions = ReportQuestions.__table__
+
+CHANGES_TABLE = "report_record_changes"
+FTS_TABLE = "report_records_fts"
+# joins the text fields of a record in its full-text row
+FIELD_SEP = "\x1f"
+# CROSS JOIN keeps json_each as the outer loop, so each key is one primary key lookup
+_BODY = (
+    "(SELECT group_concat(j.value, char(31)) FROM json_each({rec}.payload) j "
+    "CROSS JOIN report_field_keys k ON k.report_type_id = {rec}.report_type_id AND k.key = j.key "
+    "WHERE k.searchable AND j.type = 'text')"
+)
+
+
+def _path(key: str):
+    # inlined rather than bound so the expression matches the index definition
+    return literal_column(f"'$.{key}'")
+
+
+class JsonStore(RecordStore):
+    name = "json"
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._schema_ready = False
+        # report type id -> {field name: payload key}
+        self._keys: dict[int, dict[str, str]] = {}
+        self._indexed: set[str] = set()
+
+    def _ensure_schema(self):
+        if self._schema_ready:
+            return
+        with self._lock:
+            if self._schema_ready:
+                return
+            now = report_dal.NOW_SQL
+            log = CHANGES_TABLE
+            body = _BODY.format(rec="new")
+            index_new = f"INSERT INTO {FTS_TABLE}(rowid, body, report_type_id) VALUES (new.id, {body}, new.report_type_id);"
+            unindex_old = f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id;"
+            statements = [
+                f"CREATE TABLE IF NOT EXISTS {log} ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, record_id INTEGER NOT NULL UNIQUE, "
+                "report_type_id INTEGER NOT NULL, deleted INTEGER NOT NULL DEFAULT 0, "
+                "created_at VARCHAR, updated_at VARCHAR)",
+                f"CREATE INDEX IF NOT EXISTS ix_{log}_report_type ON {log}(report_type_id, seq)",
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "body, report_type_id UNINDEXED, tokenize='trigram')",
+                # REPLACE drops the record's previous row, so the log stays one row per record
+                f"CREATE TRIGGER IF NOT EXISTS report_records_ai AFTER INSERT ON report_records BEGIN "
+                f"INSERT OR REPLACE INTO {log}(record_id, report_type_id, deleted, created_at, updated_at) "
+                f"VALUES (new.id, new.report_type_id, 0, new.created_at, new.updated_at); {index_new} END",
+                f"CREATE TRIGGER IF NOT EXISTS report_records_au AFTER UPDATE ON report_records BEGIN "
+                f"INSERT OR REPLACE INTO {log}(record_id, report_type_id, deleted, created_at, updated_at) "
+                f"VALUES (new.id, new.report_type_id, 0, new.created_at, new.updated_at); {unindex_old} {index_new} END",
+                f"CREATE TRIGGER IF NOT EXISTS report_records_ad AFTER DELETE ON report_records BEGIN "
+                f"INSERT OR REPLACE INTO {log}(record_id, report_type_id, deleted, created_at, updated_at) "
+                f"VALUES (old.id, old.report_type_id, 1, old.created_at, {now}); {unindex_old} END",
+            ]
+            with engine.begin() as conn:
+                for sql in statements:
+                    conn.exec_driver_sql(sql)
+            self._schema_ready = True
+
+    def _key_map(self, report_type_id: int, fields: list[str] = ()) -> dict[str, str]:
+        keys = self._keys.get(report_type_id)
+        # a field without a key was renamed or added, possibly by another worker process
+        if keys is None or any(f not in keys for f in fields):
+            with engine.connect() as conn:
+                rows = conn.execute(
+                    select([_field_keys.c.name, _field_keys.c.key]).where(_field_keys.c.report_type_id == report_type_id)
+                )
+                keys = {name: key for name, key in rows}
+            self._keys[report_type_id] = keys
+        return keys
+
+    def _assign_keys(self, rt):
+        """Give every field of ``rt`` without a payload key a new one."""
+        with self._lock:
+            self._keys.pop(rt.id, None)
+            keys = self._key_map(rt.id)
+            used = [int(k[1:]) for k in keys.values()]
+            types = rt.field_types or []
+            new = []
+            for i, f in enumerate(rt.fields):
+                if f in keys:
+                    continue
+                key = f"f{max(used, default=0) + 1}"
+                used.append(int(key[1:]))
+                searchable = (types[i] if i < len(types) else "qa") in SEARCH_FIELD_TYPES
+                new.append({"report_type_id": rt.id, "key": key, "name": f, "searchable": searchable})
+            if new:
+                with engine.begin() as conn:
+                    conn.execute(_field_keys.insert(), new)
+            self._keys.pop(rt.id, None)
+
+    def known(self, report_type_id: int) -> bool:
+        return bool(self._key_map(report_type_id))
+
+    def create(self, rt):
+        self._ensure_schema()
+        self._assign_keys(rt)
+
+    def drop(self, report_type_id: int):
+        self._ensure_schema()
+        with engine.begin() as conn:
+            conn.execute(_records.delete().where(_records.c.report_type_id == report_type_id))
+            conn.exec_driver_sql(f"DELETE FROM {CHANGES_TABLE} WHERE report_type_id = ?", (report_type_id,))
+            conn.execute(_field_keys.delete().where(_field_keys.c.report_type_id == report_type_id))
+            conn.execute(_questions.delete().where(_questions.c.report_type_id == report_type_id))
+        self._keys.pop(report_type_id, None)
+
+    def records(self, rt):
+        self._ensure_schema()
+        keys = self._key_map(rt.id, rt.fields)
+        cols = [_records.c.id] + [
+            (func.json_extract(_records.c.payload, _path(keys[f])) if f in keys else null()).label(f)
+            for f in rt.fields
+        ]
+        # SQLite flattens the subquery, so filters and ordering on a field use its index
+        return select(cols).where(_records.c.report_type_id == rt.id).subquery(f"report_{rt.id}")
+
+    def ensure_index(self, rt, field: str):
+        key = self._key_map(rt.id, rt.fields).get(field)
+        if key is None or key in self._indexed:
+            return
+        with self._lock:
+            with engine.begin() as conn:
+                conn.exec_driver_sql(
+                    f"CREATE INDEX IF NOT EXISTS ix_report_records_{key} "
+                    f"ON report_records(report_type_id, json_extract(payload, '$.{key}'), id)"
+                )
+            self._indexed.add(key)
+
+    def _payload(self, keys: dict[str, str], data: dict) -> str:
+        return json.dumps({keys[f]: v for f, v in data.items()}, ensure_ascii=False, default=str)
+
+    def insert_rows(self, conn, report_type_id: int, fields: list[str], rows: list[dict]):
+        self._ensure_schema()
+        keys = self._key_map(report_type_id, fields)
+        check_fields(rows, [f for f in fields if f in keys])
+        conn.execute(
+            _records.insert(),
+            [{"report_type_id": report_type_id, "payload": self._payload(keys, row)} for row in rows],
+        )
+
+    def update(self, conn, rt, record_id: int, data: dict):
+        keys = self._key_map(rt.id, rt.fields)
+        check_fields([data], [f for f in rt.fields if f in keys])
+        args = []
+        for f, v in data.items():
+            args += [_path(keys[f]), v]
+        conn.execute(
+            _records.update()
+            .where(and_(_records.c.id == record_id, _records.c.report_type_id == rt.id))
+            .values(payload=func.json_set(_records.c.payload, *args), updated_at=text(report_dal.NOW_SQL))
+        )
+
+    def delete(self, conn, rt, ids: list[int]):
+        conn.execute(_records.delete().where(and_(_records.c.report_type_id == rt.id, _records.c.id.in_(ids))))
+
+    def rename_fields(self, rt, new_fields: list[str]) -> bool:
+        keys = self._key_map(rt.id, rt.fields)
+        renames = [(keys[old], new) for old, new in zip(rt.fields, new_fields) if old != new and old in keys]
+        if renames:
+            # by key, so swapping two names works
+            with engine.begin() as conn:
+                for key, new in renames:
+                    conn.execute(
+                        _field_keys.update()
+                        .where(and_(_field_keys.c.report_type_id == rt.id, _field_keys.c.key == key))
+                        .values(name=new)
+                    )
+        self._keys.pop(rt.id, None)
+        return bool(renames)
+
+    def fields_changed(self, rt, renamed: bool):
+        self._assign_keys(rt)
+
+    def change_log(self, rt):
+        self._ensure_schema()
+        log = sql_table(
+            CHANGES_TABLE,
+            column("seq"), column("record_id"), column("report_type_id"), column("deleted"),
+            column("created_at"), column("updated_at"),
+        )
+        return (
+            select([log.c.seq, log.c.record_id, log.c.deleted, log.c.created_at, log.c.updated_at])
+            .where(log.c.report_type_id == rt.id)
+            .subquery(f"report_{rt.id}_changes")
+        )
+
+    def has_search_index(self, rt) -> bool:
+        return True
+
+    def rebuild_search_index(self, rt):
+        self._ensure_schema()
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DELETE FROM {FTS_TABLE} WHERE report_type_id = ?", (rt.id,))
+            conn.exec_driver_sql(
+                f"INSERT INTO {FTS_TABLE}(rowid, body, report_type_id) "
+                f"SELECT r.id, {_BODY.format(rec='r')}, r.report_type_id "
+                "FROM report_records r WHERE r.report_type_id = ?",
+                (rt.id,),
+            )
+
+    def search(self, conn, rt, match: str, marks: tuple[str, str], limit: int, offset: int) -> list[dict]:
+        self._ensure_schema()
+        keys = self._key_map(rt.id, rt.fields)
+        cols = ", ".join(
+            (f"json_extract(r.payload, '$.{keys[f]}')" if f in keys else "NULL")
+            + ' AS "' + f.replace('"', '""') + '"'
+            for f in rt.fields
+        )
+        sql = (
+            f"SELECT r.id, {cols}, snippet({FTS_TABLE}, 0, :ms, :me, '…', 16) AS snippet, "
+            f"bm25({FTS_TABLE}) AS rank FROM {FTS_TABLE} JOIN report_records r ON r.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH :q AND r.report_type_id = :rt ORDER BY rank LIMIT :limit OFFSET :offset"
+        )
+        params = {"q": match, "rt": rt.id, "ms": marks[0], "me": marks[1], "limit": limit, "offset": offset}
+        rows = [dict(r) for r in conn.execute(text(sql), params)]
+        for r in rows:
+            # keep the fields with a match, like the per-column snippet of the tables backend
+            parts = (r["snippet"] or "").split(FIELD_SEP)
+            r["snippet"] = " … ".join([p for p in parts if marks[0] in p] or parts)
+        return rows
+
+    def get_questions(self, conn, rt) -> dict | None:
+        row = conn.execute(select([_questions.c.payload]).where(_questions.c.report_type_id == rt.id)).fetchone()
+        if not row:
+            return None
+        stored = json.loads(row[0])
+        keys = self._key_map(rt.id, rt.fields)
+        return {f: stored.get(keys.get(f)) for f in rt.fields}
+
+    def set_questions(self, conn, rt, data: dict):
+        keys = self._key_map(rt.id, rt.fields)
+        stored = {}
+        row = conn.execute(select([_questions.c.payload]).where(_questions.c.report_type_id == rt.id)).fetchone()
+        if row:
+            stored = json.loads(row[0])
+            conn.execute(_questions.delete().where(_questions.c.report_type_id == rt.id))
+        stored.update({keys[f]: q for f, q in data.items() if f in keys})
+        conn.execute(_questions.insert().values(report_type_id=rt.id, payload=json.dumps(stored, ensure_ascii=False)))
+
+
+table_store = TableStore()
+json_store = JsonStore()
+STORES = {s.name: s for s in (table_store, json_store)}
+
+# report type id -> backend name
+_backends: dict[int, str] = {}
+
+
+def new_store() -> RecordStore:
+    """The configured backend, used for report types being created."""
+    backend = storage_settings()["backend"]
+    if backend not in STORES:
+        raise ValueError(f"unknown storage backend: {backend}")
+    return STORES[backend]
+
+
+def store_for(report_type_id: int) -> RecordStore:
+    """The backend holding the records of an existing report type."""
+    backend = _backends.get(report_type_id)
+    if backend is None:
+        backend = json_store.name if json_store.known(report_type_id) else table_store.name
+        _backends[report_type_id] = backend
+    return STORES[backend]
+
+
+def register(report_type_id: int, store: RecordStore):
+    _backends[report_type_id] = store.name
+
+
+def forget(report_type_id: int):
+    _backends.pop(report_type_id, None)
@@ -1,37 +1,229 @@
-from sqlalchemy import Table, Column, Integer, MetaData, String
+import threading
+from sqlalchemy import Table, Column, Index, Integer, MetaData, String
 from .database import engine
 
-metadata = MetaData(bind=engine)
+# Process-wide registry of reflected report tables.
+# key: (report_type_id, table_name) -> (schema_version, Table)
+_table_registry: dict[tuple[int, str], tuple[int, Table]] = {}
+_schema_versions: dict[int, int] = {}
+_registry_lock = threading.RLock()
+# (report_type_id, field) pairs whose lookup index is known to exist
+_ensured_indexes: set[tuple[int, str]] = set()
+# report types whose change log is known to exist
+_change_logs: set[int] = set()
+# holds the registered report tables; built on first access, not at import
+_metadata: MetaData | None = None
+
+
+def _get_metadata() -> MetaData:
+    global _metadata
+    if _metadata is None:
+        with _registry_lock:
+            if _metadata is None:
+                _metadata = MetaData(bind=engine)
+    return _metadata
+
+
+def schema_version(report_type_id: int) -> int:
+    """Return the current schema version of the report's tables."""
+    return _schema_versions.get(report_type_id, 0)
+
+
+def invalidate_report_tables(report_type_id: int):
+    """Forget cached tables of the report so the next access reflects again."""
+    with _registry_lock:
+        _schema_versions[report_type_id] = schema_version(report_type_id) + 1
+        for key in [k for k in _table_registry if k[0] == report_type_id]:
+            _, tbl = _table_registry.pop(key)
+            if _metadata is not None and tbl.name in _metadata.tables:
+                _metadata.remove(tbl)
+        for key in [k for k in _ensured_indexes if k[0] == report_type_id]:
+            _ensured_indexes.discard(key)
+        _change_logs.discard(report_type_id)
+
+
+def _is_current(entry, version: int, fields: list[str]) -> bool:
+    # a cached table missing a field had it renamed, possibly by another worker process
+    return entry is not None and entry[0] == version and all(f in entry[1].c for f in fields)
+
+
+def _registered_table(report_type_id: int, table_name: str, fields: list[str]):
+    key = (report_type_id, table_name)
+    version = schema_version(report_type_id)
+    entry = _table_registry.get(key)
+    if _is_current(entry, version, fields):
+        return entry[1]
+    with _registry_lock:
+        version = schema_version(report_type_id)
+        entry = _table_registry.get(key)
+        if _is_current(entry, version, fields):
+            return entry[1]
+        metadata = _get_metadata()
+        if table_name in metadata.tables:
+            metadata.remove(metadata.tables[table_name])
+        try:
+            table = Table(table_name, metadata, autoload_with=engine)
+        except Exception:
+            cols = [Column('id', Integer, primary_key=True)]
+            for f in fields:
+                cols.append(Column(f, String))
+            table = Table(table_name, metadata, *cols)
+            metadata.create_all(tables=[table])
+        _table_registry[key] = (version, table)
+        return table
+
 
 def get_report_table(report_type_id: int, fields: list[str]):
     table_name = f"report_{report_type_id}"
-    try:
-        table = Table(table_name, metadata, autoload_with=engine)
-    except Exception:
-        cols = [Column('id', Integer, primary_key=True)]
-        for f in fields:
-            cols.append(Column(f, String))
-        table = Table(table_name, metadata, *cols)
-        metadata.create_all(tables=[table])
+    table = _registered_table(report_type_id, table_name, fields)
+    if report_type_id not in _change_logs:
+        ensure_change_log(report_type_id)
     return table
 
 
+def ensure_field_index(report_type_id: int, field: str):
+    """Create an index on (field, id) of the report table used for filtering and keyset paging."""
+    key = (report_type_id, field)
+    if key in _ensured_indexes:
+        return
+    table = get_report_table(report_type_id, [])
+    with _registry_lock:
+        name = f"ix_report_{report_type_id}_{field}"
+        if not any(ix.name == name for ix in table.indexes):
+            Index(name, table.c[field], table.c.id).create(engine, checkfirst=True)
+        _ensured_indexes.add(key)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def search_table_name(report_type_id: int) -> str:
+    return f"report_{report_type_id}_fts"
+
+
+def has_search_index(report_type_id: int) -> bool:
+    with engine.connect() as conn:
+        return engine.dialect.has_table(conn, search_table_name(report_type_id))
+
+
+def create_search_index(report_type_id: int, fields: list[str]):
+    """(Re)build the FTS5 index over the given text fields of report_{id}.
+
+    The index is an external-content FTS5 table kept in sync by triggers on
+    the report table, so every insert, update and delete path updates it.
+    """
+    drop_search_index(report_type_id)
+    if not fields:
+        return
+    table = _quote(f"report_{report_type_id}")
+    fts_name = search_table_name(report_type_id)
+    fts = _quote(fts_name)
+    cols = ", ".join(_quote(f) for f in fields)
+    new_vals = ", ".join(f"new.{_quote(f)}" for f in fields)
+    old_vals = ", ".join(f"old.{_quote(f)}" for f in fields)
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals});"
+    insert_new = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals});"
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='report_{report_type_id}', "
+            f"content_rowid='id', tokenize='trigram')"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER {_quote(fts_name + '_ai')} AFTER INSERT ON {table} BEGIN {insert_new} END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER {_quote(fts_name + '_ad')} AFTER DELETE ON {table} BEGIN {delete_old} END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER {_quote(fts_name + '_au')} AFTER UPDATE ON {table} BEGIN {delete_old} {insert_new} END"
+        )
+        conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def drop_search_index(report_type_id: int):
+    fts_name = search_table_name(report_type_id)
+    with engine.begin() as conn:
+        for suffix in ("_ai", "_ad", "_au"):
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {_quote(fts_name + suffix)}")
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {_quote(fts_name)}")
+
+
+def change_table_name(report_type_id: int) -> str:
+    return f"report_{report_type_id}_changes"
+
+
+NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+
+def ensure_change_log(report_type_id: int):
+    """Create the change log of report_{id} and its triggers if missing.
+
+    The log holds one row per record: its latest change sequence number
+    (``seq``, AUTOINCREMENT so it never goes backwards or is reused),
+    created/updated timestamps (UTC) and a ``deleted`` flag, so deletes
+    leave a tombstone. Triggers on the report table keep it current for
+    every write path. Rows that existed before the log get ``seq`` values
+    but no timestamps.
+    """
+    with _registry_lock:
+        if report_type_id in _change_logs:
+            return
+        table = _quote(f"report_{report_type_id}")
+        name = change_table_name(report_type_id)
+        log = _quote(name)
+        created = f"(SELECT created_at FROM {log} WHERE record_id = old.id)"
+        with engine.begin() as conn:
+            exists = engine.dialect.has_table(conn, name)
+            conn.exec_driver_sql(
+                f"CREATE TABLE IF NOT EXISTS {log} ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, record_id INTEGER NOT NULL UNIQUE, "
+                "deleted INTEGER NOT NULL DEFAULT 0, created_at VARCHAR, updated_at VARCHAR)"
+            )
+            if not exists:
+                conn.exec_driver_sql(f"INSERT INTO {log}(record_id) SELECT id FROM {table} ORDER BY id")
+            # REPLACE drops the record's previous row, so the log stays one row per record
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS {_quote(name + '_ai')} AFTER INSERT ON {table} BEGIN "
+                f"INSERT OR REPLACE INTO {log}(record_id, deleted, created_at, updated_at) "
+                f"VALUES (new.id, 0, {NOW_SQL}, {NOW_SQL}); END"
+            )
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS {_quote(name + '_au')} AFTER UPDATE ON {table} BEGIN "
+                f"INSERT OR REPLACE INTO {log}(record_id, deleted, created_at, updated_at) "
+                f"VALUES (new.id, 0, {created}, {NOW_SQL}); END"
+            )
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS {_quote(name + '_ad')} AFTER DELETE ON {table} BEGIN "
+                f"INSERT OR REPLACE INTO {log}(record_id, deleted, created_at, updated_at) "
+                f"VALUES (old.id, 1, {created}, {NOW_SQL}); END"
+            )
+        _change_logs.add(report_type_id)
+
+
 def drop_report_table(report_type_id: int):
     table_name = f"report_{report_type_id}"
-    if engine.dialect.has_table(engine.connect(), table_name):
-        tbl = Table(table_name, metadata, autoload_with=engine)
+    drop_search_index(report_type_id)
+    with engine.connect() as conn:
+        exists = engine.dialect.has_table(conn, table_name)
+    if exists:
+        tbl = get_report_table(report_type_id, [])
         tbl.drop(engine)
-        metadata.remove(tbl)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {_quote(change_table_name(report_type_id))}")
+    invalidate_report_tables(report_type_id)
 
 
 def rename_column(report_type_id: int, old: str, new: str):
+    """Rename a report column; the search index is dropped and must be rebuilt by the caller."""
     table_name = f"report_{report_type_id}"
+    drop_search_index(report_type_id)
     engine.execute(f'ALTER TABLE "{table_name}" RENAME COLUMN "{old}" TO "{new}"')
+    invalidate_report_tables(report_type_id)
 
 
 def delete_records(report_type_id: int, ids: list[int]):
-    table_name = f"report_{report_type_id}"
-    table = Table(table_name, metadata, autoload_with=engine)
+    table = get_report_table(report_type_id, [])
     stmt = table.delete().where(table.c.id.in_(ids))
     engine.execute(stmt)
 
@@ -40,25 +232,20 @@ def delete_records(report_type_id: int, ids: list[int]):
 def get_question_table(report_type_id: int, fields: list[str]):
     """Return the question table for the report, creating it if needed."""
     table_name = f"report_{report_type_id}_q"
-    try:
-        table = Table(table_name, metadata, autoload_with=engine)
-    except Exception:
-        cols = [Column('id', Integer, primary_key=True)]
-        for f in fields:
-            cols.append(Column(f, String))
-        table = Table(table_name, metadata, *cols)
-        metadata.create_all(tables=[table])
-    return table
+    return _registered_table(report_type_id, table_name, fields)
 
 
 def drop_question_table(report_type_id: int):
     table_name = f"report_{report_type_id}_q"
-    if engine.dialect.has_table(engine.connect(), table_name):
-        tbl = Table(table_name, metadata, autoload_with=engine)
+    with engine.connect() as conn:
+        exists = engine.dialect.has_table(conn, table_name)
+    if exists:
+        tbl = get_question_table(report_type_id, [])
         tbl.drop(engine)
-        metadata.remove(tbl)
+    invalidate_report_tables(report_type_id)
 
 
 def rename_question_column(report_type_id: int, old: str, new: str):
     table_name = f"report_{report_type_id}_q"
     engine.execute(f'ALTER TABLE "{table_name}" RENAME COLUMN "{old}" TO "{new}"')
+    invalidate_report_tables(report_type_id)
@@ -0,0 +1,190 @@
+"""Summary statistics of a report's records, computed in SQL and cached.
+
+``compute_stats`` runs one aggregate query for the record count, the
+fill rate of every field and the distinct count of every answer ("qa")
+field, a GROUP BY per answer field for its value distribution, and a GROUP BY on the change
+log's ``created_at`` day for the per-day volume. No rows are loaded into
+Python.
+
+Results are cached per report type. Inserts are applied to the cached
+result directly (count, fill, per-day and distributions whose distinct
+values are all held, up to ``max_distinct``); updates, deletes and schema
+changes drop the report's entry so the next request recomputes it.
+Version numbers keep a write that races a recomputation from being lost.
+Like the metadata cache this is per process, so ``ttl`` bounds how stale
+a result can be after writes from other workers.
+"""
+import copy
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import case, distinct, func, select
+from .config import config_store
+from .database import engine
+from .record_store import store_for
+
+# defaults, overridable with the "stats" section of config.json
+STATS_DEFAULTS = {
+    "ttl": 300,
+    "days": 30,
+    "top_values": 10,
+    "max_distinct": 200,
+}
+DISTRIBUTION_TYPES = ("qa",)
+
+
+def stats_settings() -> dict:
+    return config_store.settings("stats", STATS_DEFAULTS)
+
+
+def _field_type(report_type, i: int) -> str:
+    types = report_type.field_types or []
+    return types[i] if i < len(types) else "qa"
+
+
+def _filled(value) -> bool:
+    # same test as the SQL: trim() only strips spaces
+    return value is not None and str(value).strip(" ") != ""
+
+
+def compute_stats(report_type, settings: dict) -> dict:
+    """Aggregate the report's records; the result is the cacheable internal form."""
+    store = store_for(report_type.id)
+    table = store.records(report_type)
+    log = store.change_log(report_type)
+    fields = list(report_type.fields)
+    grouped = [f for i, f in enumerate(fields) if _field_type(report_type, i) in DISTRIBUTION_TYPES]
+    nonblank = {f: func.trim(func.coalesce(table.c[f], "")) != "" for f in fields}
+    cols = [func.count()]
+    cols += [func.coalesce(func.sum(case([(nonblank[f], 1)], else_=0)), 0) for f in fields]
+    cols += [func.count(distinct(case([(nonblank[f], table.c[f])]))) for f in grouped]
+    max_distinct = int(settings["max_distinct"])
+    since = (datetime.now(timezone.utc) - timedelta(days=int(settings["days"]) - 1)).strftime("%Y-%m-%d")
+    day = func.substr(log.c.created_at, 1, 10)
+    with engine.connect() as conn:
+        row = conn.execute(select(cols)).fetchone()
+        result = {"total": row[0], "fields": {}}
+        for i, f in enumerate(fields):
+            entry = {"filled": row[1 + i], "distinct": None, "counts": None, "complete": False}
+            if f in grouped:
+                entry["distinct"] = row[1 + len(fields) + grouped.index(f)]
+                n = func.count().label("n")
+                limit = max_distinct if entry["distinct"] <= max_distinct else int(settings["top_values"])
+                groups = conn.execute(
+                    select([table.c[f], n]).where(nonblank[f]).group_by(table.c[f])
+                    .order_by(n.desc(), table.c[f]).limit(limit)
+                )
+                entry["counts"] = {v: c for v, c in groups}
+                entry["complete"] = entry["distinct"] <= max_distinct
+            result["fields"][f] = entry
+        days = conn.execute(
+            select([day, func.count()]).where(log.c.deleted == 0).where(log.c.created_at >= since)
+            .group_by(day)
+        )
+        result["per_day"] = {d: c for d, c in days}
+        result["undated"] = conn.execute(
+            select([func.count()]).select_from(log).where(log.c.deleted == 0).where(log.c.created_at.is_(None))
+        ).scalar()
+    return result
+
+
+def render(report_type, stats: dict, settings: dict) -> dict:
+    """Public form of a cached result."""
+    total = stats["total"]
+    top = int(settings["top_values"])
+    fields = []
+    for i, f in enumerate(report_type.fields):
+        entry = stats["fields"].get(f)
+        if entry is None:
+            continue
+        item = {
+            "field": f,
+            "type": _field_type(report_type, i),
+            "filled": entry["filled"],
+            "fill_rate": round(entry["filled"] / total, 4) if total else 0.0,
+        }
+        if entry["counts"] is not None:
+            item["distinct"] = entry["distinct"]
+            ranked = sorted(entry["counts"].items(), key=lambda kv: (-kv[1], str(kv[0])))[:top]
+            item["top_values"] = [{"value": v, "count": c} for v, c in ranked]
+        fields.append(item)
+    today = datetime.now(timezone.utc).date()
+    days = [(today - timedelta(days=n)).isoformat() for n in range(int(settings["days"]) - 1, -1, -1)]
+    return {
+        "total": total,
+        "fields": fields,
+        "per_day": [{"date": d, "count": stats["per_day"].get(d, 0)} for d in days],
+        "undated": stats["undated"],
+    }
+
+
+class StatsCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: dict[int, int] = {}
+        # report type id -> (version, computed at, stats)
+        self._entries: dict[int, tuple[int, float, dict]] = {}
+
+    def version(self, report_type_id: int) -> int:
+        return self._versions.get(report_type_id, 0)
+
+    def get(self, report_type, settings: dict) -> tuple[dict, bool]:
+        """Return (stats, cached); recomputes when missing, invalidated or older than ttl."""
+        entry = self._entries.get(report_type.id)
+        if (
+            entry is not None
+            and entry[0] == self.version(report_type.id)
+            and time.time() - entry[1] < float(settings["ttl"])
+        ):
+            return entry[2], True
+        version = self.version(report_type.id)
+        stats = compute_stats(report_type, settings)
+        with self._lock:
+            # a write during the computation bumped the version; don't cache a result that may miss it
+            if version == self.version(report_type.id):
+                self._entries[report_type.id] = (version, time.time(), stats)
+        return stats, False
+
+    def invalidate(self, report_type_id: int):
+        with self._lock:
+            self._versions[report_type_id] = self.version(report_type_id) + 1
+            self._entries.pop(report_type_id, None)
+
+    def records_inserted(self, report_type, rows: list[dict]):
+        """Apply inserted rows to the cached result, or drop it if that can't be done exactly."""
+        max_distinct = int(stats_settings()["max_distinct"])
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        with self._lock:
+            current = self.version(report_type.id)
+            self._versions[report_type.id] = current + 1
+            entry = self._entries.pop(report_type.id, None)
+            if entry is None or entry[0] != current:
+                return
+            # readers hold the cached dict outside the lock; update a copy and swap it in
+            stats = copy.deepcopy(entry[2])
+            for row in rows:
+                stats["total"] += 1
+                stats["per_day"][today] = stats["per_day"].get(today, 0) + 1
+                for f, value in row.items():
+                    fs = stats["fields"].get(f)
+                    if fs is None or not _filled(value):
+                        continue
+                    fs["filled"] += 1
+                    counts = fs["counts"]
+                    if counts is None:
+                        continue
+                    if not isinstance(value, str):
+                        # stored as text by one backend and as a number by the other
+                        return
+                    if not fs["complete"]:
+                        # only the top values are held; a new value could enter them
+                        return
+                    if value not in counts:
+                        fs["distinct"] += 1
+                        if fs["distinct"] > max_distinct:
+                            return
+                    counts[value] = counts.get(value, 0) + 1
+            self._entries[report_type.id] = (current + 1, entry[1], stats)
+
+
+stats_cache = StatsCache()
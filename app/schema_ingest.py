@@ -0,0 +1,176 @@
+"""Derive report fields from an uploaded Excel or PDF template.
+
+Only what is needed is read: the header row of the first sheet, or PDF
+pages until ``MAX_FIELDS`` non-empty lines have been found (at most
+``max_pdf_pages``). Parsing runs in a process pool so a large or hostile
+file cannot block the event loop; each job is limited to ``timeout``
+seconds and each worker to ``memory_mb`` of address space. Results are
+cached by the SHA-256 of the file.
+"""
+import asyncio
+import hashlib
+import io
+import signal
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from .config import config_store
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+MAX_FIELDS = 10
+
+# defaults, overridable with the "ingest" section of config.json
+INGEST_DEFAULTS = {
+    "workers": 2,
+    "timeout": 30.0,
+    "memory_mb": 1024,
+    "max_pdf_pages": 20,
+    "max_file_mb": 50,
+    "cache_entries": 256,
+}
+
+
+class IngestError(Exception):
+    pass
+
+
+def ingest_settings() -> dict:
+    return config_store.settings("ingest", INGEST_DEFAULTS)
+
+
+def _unique(values) -> list[str]:
+    seen = []
+    for v in values:
+        if v not in seen:
+            seen.append(v)
+    return seen
+
+
+def excel_header_fields(contents: bytes) -> list[str]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(contents), read_only=True, data_only=True)
+    try:
+        header = next(wb.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+    finally:
+        wb.close()
+    return _unique(str(v).strip() for v in header if v is not None and str(v).strip())
+
+
+def pdf_line_fields(contents: bytes, max_pages: int, limit: int = MAX_FIELDS) -> list[str]:
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    lines: list[str] = []
+    # extract_pages is lazy, so pages after the last needed one are never parsed
+    for page in extract_pages(io.BytesIO(contents), maxpages=max_pages):
+        for element in page:
+            if isinstance(element, LTTextContainer):
+                lines.extend(l.strip() for l in element.get_text().splitlines() if l.strip())
+        if len(lines) >= limit:
+            break
+    return lines[:limit]
+
+
+def _alarm(signum, frame):
+    raise TimeoutError("file parsing timed out")
+
+
+def _worker_init(memory_mb: int):
+    if resource is not None and memory_mb:
+        limit = int(memory_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _derive(kind: str, contents: bytes, max_pages: int, timeout: float) -> list[str]:
+    """Runs in a worker process."""
+    if hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        if kind == "xlsx":
+            return excel_header_fields(contents)
+        return pdf_line_fields(contents, max_pages)
+    finally:
+        if hasattr(signal, "SIGALRM"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class SchemaIngestor:
+    def __init__(self):
+        self._pool: ProcessPoolExecutor | None = None
+        self._cache: OrderedDict[str, list[str]] = OrderedDict()
+
+    def _get_pool(self, settings: dict) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs threads and an event loop is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=int(settings["workers"]),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+                initargs=(int(settings["memory_mb"]),),
+            )
+        return self._pool
+
+    def _discard_pool(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            # a worker that ignored the alarm is still busy; kill it
+            for proc in list((getattr(pool, "_processes", None) or {}).values()):
+                proc.kill()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def derive_fields(self, filename: str, contents: bytes) -> list[str]:
+        """Return the field names for an .xlsx or .pdf template; raises IngestError."""
+        name = (filename or "").lower()
+        if name.endswith(".xlsx"):
+            kind = "xlsx"
+        elif name.endswith(".pdf"):
+            kind = "pdf"
+        else:
+            return []
+        settings = ingest_settings()
+        if len(contents) > float(settings["max_file_mb"]) * 1024 * 1024:
+            raise IngestError("file is too large")
+        key = f"{kind}:{settings['max_pdf_pages']}:{hashlib.sha256(contents).hexdigest()}"
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return list(self._cache[key])
+
+        timeout = float(settings["timeout"])
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._get_pool(settings), _derive, kind, contents, int(settings["max_pdf_pages"]), timeout
+        )
+        try:
+            # the alarm in the worker fires first; this only covers a stuck worker
+            fields = await asyncio.wait_for(future, timeout + 5)
+        except TimeoutError:
+            if future.cancelled():
+                self._discard_pool()
+            raise IngestError("file parsing timed out")
+        except BrokenProcessPool:
+            self._discard_pool()
+            raise IngestError("file parsing exceeded the memory limit")
+        except MemoryError:
+            raise IngestError("file parsing exceeded the memory limit")
+        except Exception as e:
+            raise IngestError(f"could not read file: {e}")
+
+        self._cache[key] = fields
+        while len(self._cache) > int(settings["cache_entries"]):
+            self._cache.popitem(last=False)
+        return list(fields)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+schema_ingestor = SchemaIngestor()
@@ -0,0 +1,66 @@
+"""Change counters shared by all worker processes through the database.
+
+A process that changes something other workers cache (report metadata,
+the parse cache) calls ``bump`` with the scope after committing it. Every
+process re-reads the ``shared_versions`` table at most every
+``CHECK_INTERVAL`` seconds, so caches keyed on ``version(scope)`` see
+changes made through another worker within that time, and their own
+changes at once. Versions only grow.
+"""
+import threading
+import time
+from sqlalchemy import select, update
+from .database import engine
+from .models import SharedVersion
+
+CHECK_INTERVAL = 1.0
+
+_table = SharedVersion.__table__
+_lock = threading.Lock()
+_versions: dict[str, int] = {}
+_checked = float("-inf")
+
+
+def _install(rows):
+    with _lock:
+        for scope, version in rows:
+            if version > _versions.get(scope, 0):
+                _versions[scope] = version
+
+
+def refresh(force: bool = False):
+    """Re-read the counters if the last read is older than CHECK_INTERVAL."""
+    global _checked
+    now = time.monotonic()
+    with _lock:
+        if not force and now - _checked < CHECK_INTERVAL:
+            return
+        _checked = now
+    with engine.connect() as conn:
+        _install(conn.execute(select([_table.c.scope, _table.c.version])).fetchall())
+
+
+def version(scope: str) -> int:
+    refresh()
+    return _versions.get(scope, 0)
+
+
+def snapshot() -> dict[str, int]:
+    refresh()
+    with _lock:
+        return dict(_versions)
+
+
+def bump(*scopes: str):
+    """Mark scopes as changed; call after the change has been committed."""
+    if not scopes:
+        return
+    with engine.begin() as conn:
+        for scope in scopes:
+            bumped = conn.execute(
+                update(_table).where(_table.c.scope == scope).values(version=_table.c.version + 1)
+            )
+            if not bumped.rowcount:
+                conn.execute(_table.insert().values(scope=scope, version=1))
+        rows = conn.execute(select([_table.c.scope, _table.c.version]).where(_table.c.scope.in_(scopes))).fetchall()
+    _install(rows)
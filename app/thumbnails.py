@@ -0,0 +1,176 @@
+"""Small preview images for image and video fields.
+
+Derivatives are stored next to the original upload: ``<hash>.thumb.jpg``
+for images (Pillow) and ``<hash>.poster.jpg`` for videos (a representative
+frame extracted with ffmpeg). They are generated in a background thread
+pool right after the upload is stored, or on first request for files
+uploaded before; previews that cannot be produced (Pillow or ffmpeg
+missing, unreadable file) are simply not available.
+"""
+import asyncio
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlencode
+from .config import config_store
+from .media_storage import UPLOAD_SUBDIR, upload_store
+
+logger = logging.getLogger(__name__)
+
+# defaults, overridable with the "thumbnails" section of config.json
+THUMBNAIL_DEFAULTS = {
+    "size": 240,
+    "quality": 80,
+    "workers": 2,
+    "ffmpeg": "ffmpeg",
+    "ffmpeg_timeout": 30.0,
+}
+SUFFIXES = {"image": ".thumb.jpg", "video": ".poster.jpg"}
+MAX_FAILED = 10000
+
+
+def thumbnail_settings() -> dict:
+    return config_store.settings("thumbnails", THUMBNAIL_DEFAULTS)
+
+
+def derivative_path(relpath: str, kind: str) -> str:
+    """Name in the upload store of the preview of an uploaded file."""
+    return os.path.splitext(relpath)[0] + SUFFIXES[kind]
+
+
+def _is_upload(relpath: str) -> bool:
+    norm = os.path.normpath(relpath or "")
+    return (
+        norm.startswith(UPLOAD_SUBDIR + os.sep)
+        and ".." not in norm.split(os.sep)
+        and os.path.isfile(upload_store.path(norm))
+    )
+
+
+def _save_atomic(dest: str, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=".thumb-", suffix=".jpg")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _image_thumbnail(src: str, dest: str, settings: dict):
+    from PIL import Image, ImageOps
+
+    size = int(settings["size"])
+
+    def write(tmp):
+        with Image.open(src) as im:
+            im.draft("RGB", (size, size))  # lets JPEG decode at reduced scale
+            im = ImageOps.exif_transpose(im)
+            im.thumbnail((size, size))
+            im.convert("RGB").save(tmp, "JPEG", quality=int(settings["quality"]), optimize=True)
+
+    _save_atomic(dest, write)
+
+
+def _video_poster(src: str, dest: str, settings: dict):
+    size = int(settings["size"])
+
+    def write(tmp):
+        subprocess.run(
+            [
+                settings["ffmpeg"], "-v", "error", "-y", "-i", src,
+                "-vf", f"thumbnail,scale='min({size},iw)':-2", "-frames:v", "1", tmp,
+            ],
+            check=True,
+            capture_output=True,
+            timeout=float(settings["ffmpeg_timeout"]),
+        )
+        if not os.path.getsize(tmp):
+            raise RuntimeError("ffmpeg produced no frame")
+
+    _save_atomic(dest, write)
+
+
+def generate(relpath: str, kind: str) -> str | None:
+    """Create the preview if missing; returns its relative path, or None if it can't be made."""
+    dest_rel = derivative_path(relpath, kind)
+    dest = upload_store.path(dest_rel)
+    if os.path.exists(dest):
+        return dest_rel
+    settings = thumbnail_settings()
+    src = upload_store.path(relpath)
+    try:
+        if kind == "image":
+            _image_thumbnail(src, dest, settings)
+        else:
+            _video_poster(src, dest, settings)
+    except Exception as e:
+        logger.info("no %s preview for %s: %s", kind, relpath, e)
+        return None
+    return dest_rel
+
+
+class ThumbnailPool:
+    def __init__(self):
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending: dict[str, Future] = {}
+        # previews that could not be made, so page views don't retry them
+        self._failed: set[str] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, relpath: str, kind: str) -> Future:
+        """Queue generation; concurrent requests for the same file share one job."""
+        key = derivative_path(relpath, kind)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=int(thumbnail_settings()["workers"]), thread_name_prefix="thumbnail"
+                )
+            future = self._executor.submit(generate, relpath, kind)
+            self._pending[key] = future
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def _forget(self, key: str, future: Future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if not future.cancelled() and future.result() is None:
+                if len(self._failed) >= MAX_FAILED:
+                    self._failed.clear()
+                self._failed.add(key)
+
+    async def get(self, relpath: str, kind: str) -> str | None:
+        """Relative path of the preview, generating it first if needed."""
+        if kind not in SUFFIXES or not _is_upload(relpath):
+            return None
+        existing = derivative_path(relpath, kind)
+        if os.path.exists(upload_store.path(existing)):
+            return existing
+        if existing in self._failed:
+            return None
+        return await asyncio.wrap_future(self.submit(relpath, kind))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+thumbnail_pool = ThumbnailPool()
+
+
+def thumbnail_url(relpath: str | None, kind: str) -> str | None:
+    """URL of the preview: the static file if it exists, otherwise the lazy endpoint."""
+    if not relpath or kind not in SUFFIXES:
+        return None
+    derived = derivative_path(relpath, kind)
+    if os.path.exists(upload_store.path(derived)):
+        return f"/static/{derived}"
+    return "/media/thumbnail?" + urlencode({"path": relpath, "kind": kind})
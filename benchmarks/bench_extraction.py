@@ -0,0 +1,83 @@
+"""Parse latency on a long text: one prompt vs concurrent chunked extraction.
+
+The fake OpenAI endpoint charges ``--per-1k-chars`` seconds per 1000 prompt
+characters on top of ``--latency``, so a single pass over a 20 page text
+pays for the whole prompt while chunks pay for theirs concurrently.
+
+Usage: python benchmarks/bench_extraction.py [--pages 20] [--fields 10] [--latency 0.5] [--per-1k-chars 0.05] [--runs 3]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix="genereport-bench-"))
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+import httpx  # noqa: E402
+from fake_openai import create_app as create_fake_openai  # noqa: E402
+from app.config import config_store  # noqa: E402
+from app.extraction import count_tokens, extraction_settings  # noqa: E402
+from app.openai_util import aparse_text_to_fields, configure_gateway  # noqa: E402
+
+# settings changed below must not touch the project's config.json
+config_store.path = os.path.abspath("config.json")
+
+PAGE = (
+    "患者は65歳男性。既往歴として高血圧と2型糖尿病があり、内服加療中である。\n"
+    "本日の採血では白血球数6800/μL、ヘモグロビン13.2g/dL、血小板数21万/μLであった。\n"
+    "遺伝子検査の結果、対象領域に病的バリアントは検出されなかった。\n"
+) * 12
+
+
+async def timed(text: str, fields: list[str], runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        await aparse_text_to_fields(text, fields, use_cache=False)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def main_async(args):
+    fake = create_fake_openai(args.latency, per_1k_chars=args.per_1k_chars)
+    configure_gateway(transport=httpx.ASGITransport(app=fake))
+    fields = [f"項目{i}" for i in range(args.fields)]
+    page = PAGE
+    text = page * args.pages
+    cfg = extraction_settings()
+    print(f"{args.pages} pages, {len(text)} chars, ~{count_tokens(text)} tokens, {args.fields} fields")
+
+    config_store.update_section("extraction", {"single_pass_tokens": 10 ** 9})
+    one_page = await timed(page, fields, args.runs)
+    calls = fake.state.calls
+    single = await timed(text, fields, args.runs)
+    single_calls = (fake.state.calls - calls) // args.runs
+    config_store.update_section("extraction", cfg)
+    calls = fake.state.calls
+    chunked = await timed(text, fields, args.runs)
+    chunk_calls = (fake.state.calls - calls) // args.runs
+
+    print(f"{'one page':<12} {one_page:.3f}s")
+    print(f"{'single pass':<12} {single:.3f}s  {single_calls} call(s)")
+    print(f"{'chunked':<12} {chunked:.3f}s  {chunk_calls} call(s)")
+    print(f"speedup      {single / chunked:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--fields", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--per-1k-chars", type=float, default=0.05)
+    parser.add_argument("--runs", type=int, default=3)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Concurrent insert throughput: commit per insert vs the group-commit writer.
+
+Usage: python benchmarks/bench_group_commit.py [threads] [rows_per_thread]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="genereport-bench-"))
+
+from app.database import Base, engine, SessionLocal  # noqa: E402
+from app import crud, write_queue  # noqa: E402
+
+
+def run(label, rt, threads, rows):
+    data = {f: "value" for f in rt.fields}
+    errors = []
+
+    def worker():
+        db = SessionLocal()
+        try:
+            for _ in range(rows):
+                crud.insert_report_record(db, rt, data)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    total = threads * rows
+    print(f"{label:<14} {total} rows  {elapsed:.3f}s  {total / elapsed:,.0f} rows/s  errors={len(errors)}")
+    return elapsed
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        pragmas = {p: conn.exec_driver_sql(f"PRAGMA {p}").scalar() for p in ("journal_mode", "synchronous")}
+    print(f"pragmas: {pragmas}")
+    db = SessionLocal()
+    fields = [f"field_{i}" for i in range(10)]
+    rt = crud.create_report_type(db, "bench", fields, [], ["qa"] * len(fields), "smart")
+    db.expunge(rt)
+    db.close()
+
+    write_queue.writer = None
+    direct = run("direct commit", rt, threads, rows)
+    write_queue.writer = write_queue.GroupCommitWriter()
+    grouped = run("group commit", rt, threads, rows)
+    print(f"writer stats: {write_queue.writer.stats}")
+    write_queue.writer.stop()
+    print(f"speedup        {direct / grouped:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Spreadsheet import throughput and the values it stores.
+
+Writes an .xlsx and a .csv file of ``rows`` rows whose columns mix
+integers, integral and fractional floats, text and blank cells (a blank
+row every ``--blank-every`` rows), imports each with ``import_records``
+and prints rows per second per format. Every stored value is compared
+with the expected text, e.g. ``12.0`` is stored as ``"12"`` whatever the
+other cells of its chunk hold; exits with status 1 on a mismatch.
+
+Usage: python benchmarks/bench_import.py [--rows 20000] [--chunk-size 1000] [--blank-every 50]
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="genereport-bench-"))
+
+from app.config import config_store  # noqa: E402
+from app.database import Base, engine, SessionLocal  # noqa: E402
+from app.bulk_import import import_records  # noqa: E402
+from app import crud  # noqa: E402
+
+config_store.path = os.path.abspath("config.json")
+FIELDS = ["count", "mixed", "ratio", "note"]
+
+
+def cells(i: int, blank_every: int) -> tuple[list, list[str]]:
+    """One row as written to the file, and the text the import should store."""
+    if i % blank_every == 0:
+        return [None] * len(FIELDS), None
+    count = float(i) if i % 3 else None
+    mixed = [float(i % 7), i % 5 + 0.5, f"v{i}", None][i % 4]
+    ratio = i / 4
+    note = " " if i % 11 == 0 else f"note {i}"
+    row = [count, mixed, ratio, note]
+
+    def text(v):
+        if v is None:
+            return ""
+        if isinstance(v, float) and v.is_integer():
+            return str(int(v))
+        return str(v)
+
+    return row, [text(v) for v in row]
+
+
+def write_files(args) -> tuple[dict, list]:
+    from openpyxl import Workbook
+
+    rows, expected = [], []
+    for i in range(1, args.rows + 1):
+        row, text = cells(i, args.blank_every)
+        rows.append(row)
+        if text is not None:
+            expected.append(text)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(FIELDS)
+    for row in rows:
+        ws.append(row)
+    wb.save("rows.xlsx")
+    with open("rows.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for row in rows:
+            # a CSV carries what Excel would export: 12 rather than 12.0
+            writer.writerow(["" if v is None else (int(v) if isinstance(v, float) and v.is_integer() else v) for v in row])
+    return {"xlsx": "rows.xlsx", "csv": "rows.csv"}, expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--blank-every", type=int, default=50)
+    args = parser.parse_args()
+    Base.metadata.create_all(bind=engine)
+    files, expected = write_files(args)
+    db = SessionLocal()
+    failures = []
+    print(f"{args.rows} rows, chunks of {args.chunk_size}")
+    for fmt, path in files.items():
+        rt = crud.create_report_type(db, f"import_{fmt}", FIELDS, [], ["qa"] * len(FIELDS), "struct")
+        with open(path, "rb") as f:
+            summary = import_records(db, rt, path, f, args.chunk_size)
+        print(f"{fmt:<6} {summary['rows'] / summary['elapsed']:>10,.0f} rows/s  "
+              f"imported {summary['imported']}  rejected {summary['rejected']}")
+        stored, _ = crud.fetch_report_records_page(db, rt, args.rows)
+        got = [[r[f] for f in FIELDS] for r in stored]
+        if got != expected:
+            bad = next((i for i, (g, e) in enumerate(zip(got, expected)) if g != e), min(len(got), len(expected)))
+            failures.append(f"{fmt}: row {bad} stored {got[bad] if bad < len(got) else None}, "
+                            f"expected {expected[bad] if bad < len(expected) else None}")
+    db.close()
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
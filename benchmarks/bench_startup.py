@@ -0,0 +1,129 @@
+"""Cold start of the app: import time and time to the first served request.
+
+Each run starts a fresh interpreter. The import profile (``-X importtime``)
+lists the modules that cost the most, and the script checks that the
+libraries loaded on first use (Excel, PDF, imaging) stay out of
+the import. Time to first request is measured from spawning uvicorn to
+the first 200 response, including the schema setup in the lifespan hook.
+Exits with status 1 when a lazy library is imported eagerly or the median
+time to first request exceeds ``--target-ms``, so it can run as a
+regression check.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--target-ms 1500] [--top 15]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# loaded by the code paths that need them, never by importing app.main
+LAZY_MODULES = ["pandas", "openpyxl", "pdfminer", "PIL"]
+
+PROBE = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import app.main\n"
+    "elapsed = time.perf_counter() - start\n"
+    f"print(json.dumps({{'import_s': elapsed, 'eager': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))\n"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def workdir() -> str:
+    path = tempfile.mkdtemp(prefix="genereport-startup-")
+    os.symlink(os.path.join(ROOT, "templates"), os.path.join(path, "templates"))
+    os.makedirs(os.path.join(path, "static"))
+    return path
+
+
+def env() -> dict:
+    e = dict(os.environ)
+    e["PYTHONPATH"] = ROOT + os.pathsep + e.get("PYTHONPATH", "")
+    e.setdefault("OPENAI_API_KEY", "fake-key")
+    return e
+
+
+def import_profile(top: int) -> tuple[dict, list[tuple[int, str]]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=workdir(), env=env(), capture_output=True, text=True, check=True,
+    )
+    costs = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            costs.append((int(cumulative), name.strip()))
+    return json.loads(proc.stdout.strip().splitlines()[-1]), sorted(costs, reverse=True)[:top]
+
+
+def first_request_seconds() -> float:
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir(), env=env(),
+    )
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target-ms", type=float, default=1500)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    probes = []
+    for _ in range(args.runs):
+        probe, costs = import_profile(args.top)
+        probes.append(probe)
+    print("slowest imports (cumulative, last run):")
+    for us, name in costs:
+        print(f"  {us / 1000:>8.1f}ms  {name}")
+    import_ms = statistics.median(p["import_s"] for p in probes) * 1000
+    eager = sorted({m for p in probes for m in p["eager"]})
+    print(f"import app.main   median {import_ms:.0f}ms")
+
+    first = [first_request_seconds() * 1000 for _ in range(args.runs)]
+    first_ms = statistics.median(first)
+    print(f"first request     median {first_ms:.0f}ms  (min {min(first):.0f}ms, max {max(first):.0f}ms, target {args.target_ms:.0f}ms)")
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported at startup: {', '.join(eager)}")
+        failed = True
+    if first_ms > args.target_ms:
+        print("FAIL: time to first request over target")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
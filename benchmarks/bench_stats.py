@@ -0,0 +1,93 @@
+"""Cost of the records summary (``/api/report/stats``) on a large report.
+
+Loads ``rows`` records into one report type of each storage backend and
+times a full computation, a cache hit, and the request following a
+single insert (applied to the cached result) and a single update (which
+invalidates it), printing one column per backend.
+
+Usage: python benchmarks/bench_stats.py [--rows 100000] [--fields 20] [--ops 50]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="genereport-bench-"))
+
+from app.config import config_store  # noqa: E402
+from app.database import Base, engine, SessionLocal  # noqa: E402
+from app.report_stats import stats_cache  # noqa: E402
+from app import crud  # noqa: E402
+
+# settings changed below must not touch the project's config.json
+config_store.path = os.path.abspath("config.json")
+BACKENDS = ["tables", "json"]
+WORDS = ["BRCA1", "TP53", "EGFR", "KRAS", "陽性", "陰性", "変異なし", "要再検査"]
+
+
+def timed(fn, n: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def run(backend: str, args) -> dict:
+    config_store.update_section("storage", {"backend": backend})
+    db = SessionLocal()
+    rng = random.Random(0)
+    fields = [f"field_{i}" for i in range(args.fields)]
+    types = ["qa"] * (args.fields - args.fields // 4) + ["free"] * (args.fields // 4)
+    rt = crud.create_report_type(db, f"stats_{backend}", fields, [], types, "smart")
+
+    def row():
+        return {f: rng.choice(WORDS + [""]) if t == "qa" else f"note {rng.random()}" for f, t in zip(fields, types)}
+
+    for start in range(0, args.rows, 5000):
+        crud.bulk_insert_report_records(db, rt, [row() for _ in range(min(5000, args.rows - start))])
+    stats = {}
+
+    def cold():
+        stats_cache.invalidate(rt.id)
+        crud.fetch_report_stats(rt)
+
+    stats["compute (ms)"] = timed(cold, max(1, args.ops // 10)) * 1000
+    crud.fetch_report_stats(rt)
+    stats["cached (ms)"] = timed(lambda: crud.fetch_report_stats(rt), args.ops) * 1000
+
+    def after_insert():
+        crud.insert_report_record(db, rt, row())
+        crud.fetch_report_stats(rt)
+
+    stats["insert + read (ms)"] = timed(after_insert, args.ops) * 1000
+    rows, _ = crud.fetch_report_records_page(db, rt, args.ops)
+
+    def after_update():
+        crud.update_report_record(db, rt, rng.choice(rows)["id"], {fields[0]: rng.choice(WORDS)})
+        crud.fetch_report_stats(rt)
+
+    stats["update + read (ms)"] = timed(after_update, max(1, args.ops // 10)) * 1000
+    db.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--fields", type=int, default=20)
+    parser.add_argument("--ops", type=int, default=50)
+    args = parser.parse_args()
+    Base.metadata.create_all(bind=engine)
+    results = {b: run(b, args) for b in BACKENDS}
+    print(f"{args.rows} rows x {args.fields} fields")
+    print(f"{'':<22}" + "".join(f"{b:>12}" for b in BACKENDS))
+    for key in results[BACKENDS[0]]:
+        print(f"{key:<22}" + "".join(f"{results[b][key]:>12.2f}" for b in BACKENDS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Record storage backends side by side: per-report tables vs one JSON table.
+
+For each backend, creates ``types`` report types of ``fields`` fields,
+bulk-loads ``rows`` records into each and times single inserts, filtered
+and sorted page reads, full-text search and a field rename, then prints
+one column per backend.
+
+Usage: python benchmarks/bench_storage.py [--types 50] [--fields 20] [--rows 2000] [--ops 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="genereport-bench-"))
+
+from app.config import config_store  # noqa: E402
+from app.database import Base, engine, SessionLocal  # noqa: E402
+from app import crud  # noqa: E402
+
+# settings changed below must not touch the project's config.json
+config_store.path = os.path.abspath("config.json")
+BACKENDS = ["tables", "json"]
+WORDS = ["BRCA1", "TP53", "EGFR", "KRAS", "陽性", "陰性", "変異なし", "要再検査"]
+
+
+def timed(fn, n: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def run(backend: str, args) -> dict:
+    config_store.update_section("storage", {"backend": backend})
+    db = SessionLocal()
+    rng = random.Random(0)
+    fields = [f"field_{i}" for i in range(args.fields)]
+    rts = []
+    stats = {}
+    with engine.connect() as conn:
+        tables_before = conn.exec_driver_sql("SELECT count(*) FROM sqlite_master WHERE type = 'table'").scalar()
+
+    def create():
+        rt = crud.create_report_type(db, f"{backend}_{len(rts)}", fields, [], ["qa"] * args.fields, "smart")
+        rts.append(rt)
+
+    stats["create type (ms)"] = timed(create, args.types) * 1000
+
+    def row():
+        return {f: rng.choice(WORDS) + str(rng.randint(0, 99)) for f in fields}
+
+    start = time.perf_counter()
+    for rt in rts:
+        crud.bulk_insert_report_records(db, rt, [row() for _ in range(args.rows)])
+    stats["bulk load (rows/s)"] = args.types * args.rows / (time.perf_counter() - start)
+    stats["insert (ms)"] = timed(lambda: crud.insert_report_record(db, rng.choice(rts), row()), args.ops) * 1000
+
+    def page():
+        rt = rng.choice(rts)
+        crud.fetch_report_records_page(
+            db, rt, 50, sort=fields[1], filter_field=fields[0], filter_value=rng.choice(WORDS) + "7"
+        )
+
+    page()  # creates the indexes
+    stats["filtered page (ms)"] = timed(page, args.ops) * 1000
+    stats["first page (ms)"] = timed(lambda: crud.fetch_report_records_page(db, rng.choice(rts), 50), args.ops) * 1000
+    stats["search (ms)"] = timed(lambda: crud.search_report_records(db, rng.choice(rts), "BRCA1 陽性"), args.ops // 4) * 1000
+
+    def rename():
+        rt = rng.choice(rts)
+        new = list(rt.fields)
+        new[0] = new[0] + "_r"
+        crud.update_report_type_fields(db, rt, new)
+
+    stats["rename field (ms)"] = timed(rename, 10) * 1000
+    with engine.connect() as conn:
+        tables = conn.exec_driver_sql("SELECT count(*) FROM sqlite_master WHERE type = 'table'").scalar()
+    stats["tables created"] = tables - tables_before
+    db.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--types", type=int, default=50)
+    parser.add_argument("--fields", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--ops", type=int, default=200)
+    args = parser.parse_args()
+    Base.metadata.create_all(bind=engine)
+    results = {b: run(b, args) for b in BACKENDS}
+    print(f"{args.types} report types x {args.fields} fields x {args.rows} rows")
+    print(f"{'':<22}" + "".join(f"{b:>12}" for b in BACKENDS))
+    for key in results[BACKENDS[0]]:
+        print(f"{key:<22}" + "".join(f"{results[b][key]:>12.2f}" for b in BACKENDS))
+
+
+if __name__ == "__main__":
+    main()
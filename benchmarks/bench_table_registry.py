@@ -0,0 +1,50 @@
+"""Per-insert cost of report table lookup: reflection vs cached registry.
+
+Usage: python benchmarks/bench_table_registry.py [rows] [fields]
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="genereport-bench-"))
+
+from sqlalchemy import MetaData, Table  # noqa: E402
+from app.database import Base, engine, SessionLocal  # noqa: E402
+from app import crud, models  # noqa: E402
+
+
+def reflect_per_call(report_type: models.ReportType, data: dict, db):
+    """The old path: reflect the table from SQLite for every insert."""
+    table = Table(f"report_{report_type.id}", MetaData(), autoload_with=engine)
+    db.execute(table.insert().values(**data))
+    db.commit()
+
+
+def run(label, insert, rt, rows, db):
+    data = {f: "value" for f in rt.fields}
+    start = time.perf_counter()
+    for _ in range(rows):
+        insert(db, rt, data)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {rows} inserts  {elapsed:.3f}s  {elapsed / rows * 1e6:.1f} us/insert")
+    return elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_fields = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    fields = [f"field_{i}" for i in range(n_fields)]
+    rt = crud.create_report_type(db, "bench", fields, [], ["qa"] * n_fields, "smart")
+    before = run("reflect", lambda d, r, x: reflect_per_call(r, x, d), rt, rows, db)
+    after = run("registry", crud.insert_report_record, rt, rows, db)
+    print(f"speedup      {before / after:.2f}x")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Several app worker processes sharing one database, config file and upload root.
+
+Starts ``--workers`` uvicorn processes on separate ports. All of them point
+at the same SQLite file (``DATABASE_URL``), the same config.json
+(``CONFIG_FILE``) and the same upload root (the ``media`` section).
+``--requests`` requests are then sent round robin over the workers with
+``--concurrency`` in flight:
+
+- record inserts, every ``--upload-every``-th with an image (shared by
+  several records, so identical files are written concurrently)
+- record pages and stats reads
+- OpenAI endpoint saves through the settings page
+
+Alongside the requests, this process updates config sections of its own
+in threads. Halfway through, one worker renames a field that the others
+then write to, with table definitions cached under the old name.
+
+Afterwards the script checks that:
+
+- no request failed and every acknowledged insert is stored with its values
+- every upload is served by every worker
+- config.json is valid and no concurrent section update was lost
+- every worker serves the last OpenAI endpoint written and the renamed
+  field list (cached by all of them before the rename)
+
+It prints throughput and latency per operation, and exits with status 1
+when a check fails.
+
+Usage: python benchmarks/bench_workers.py [--workers 4] [--requests 2000] [--concurrency 32]
+           [--upload-every 10] [--config-writes 50] [--backend tables|json] [--group-commit]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.config import ConfigStore  # noqa: E402
+
+REPORT = "workers"
+FIELDS = ["result", "note", "image"]
+RENAMED = "comment"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def setup(args) -> dict:
+    work = tempfile.mkdtemp(prefix="genereport-workers-")
+    os.symlink(os.path.join(ROOT, "templates"), os.path.join(work, "templates"))
+    os.makedirs(os.path.join(work, "static"))
+    shared = os.path.join(work, "shared")
+    config = {
+        "storage": {"backend": args.backend},
+        "media": {"root": shared},
+        "database": {"group_commit": {"enabled": args.group_commit}},
+        "openai": {"endpoint": "http://127.0.0.1:9/v0", "key": "fake-key"},
+    }
+    with open(os.path.join(work, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    env = dict(os.environ)
+    env.update(
+        PYTHONPATH=ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        DATABASE_URL=f"sqlite:///{os.path.join(work, 'data.db')}",
+        CONFIG_FILE=os.path.join(work, "config.json"),
+    )
+    return {"dir": work, "env": env, "db": os.path.join(work, "data.db"), "config": env["CONFIG_FILE"]}
+
+
+def start_workers(n: int, ctx: dict) -> list[tuple[subprocess.Popen, str]]:
+    workers = []
+    for _ in range(n):
+        port = free_port()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ctx["dir"], env=ctx["env"],
+        )
+        workers.append((proc, f"http://127.0.0.1:{port}"))
+    deadline = time.monotonic() + 30
+    for proc, url in workers:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError("worker exited during startup")
+            try:
+                if httpx.get(url + "/metrics", timeout=1).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("workers did not start")
+            time.sleep(0.05)
+    return workers
+
+
+def report_type_id(ctx: dict) -> int:
+    with sqlite3.connect(ctx["db"]) as conn:
+        return conn.execute("SELECT id FROM report_types WHERE name = ?", (REPORT,)).fetchone()[0]
+
+
+class Load:
+    def __init__(self, urls: list[str], args):
+        self.urls = urls
+        self.args = args
+        self.latency = defaultdict(list)
+        self.errors = []
+        self.inserted = 0
+
+    def _ok(self, op: str, resp: httpx.Response, body: dict | None = None) -> bool:
+        if resp.status_code >= 400 or (body is not None and "error" in body):
+            self.errors.append(f"{op}: {resp.status_code} {resp.text[:200]}")
+            return False
+        return True
+
+    async def request(self, client: httpx.AsyncClient, i: int):
+        url = self.urls[i % len(self.urls)]
+        kind = i % 10
+        start = time.perf_counter()
+        if kind < 6:
+            op = "insert"
+            data = {"report_name": REPORT, "result": f"r{i % 7}", "note": f"n{i}", RENAMED: f"n{i}"}
+            files = None
+            if i % self.args.upload_every == 0:
+                op = "insert+upload"
+                files = {"image": (f"{i}.png", b"\x89PNG fake image " + str(i % 25).encode() * 2000, "image/png")}
+            resp = await client.post(url + "/api/report/record", data=data, files=files)
+            body = resp.json() if resp.status_code < 400 else None
+            if self._ok(op, resp, body):
+                self.inserted += 1
+        elif kind < 8:
+            op = "page"
+            resp = await client.get(url + "/api/report/records", params={"report_name": REPORT, "order": "desc"})
+            self._ok(op, resp, resp.json() if resp.status_code < 400 else None)
+        elif kind < 9:
+            op = "stats"
+            resp = await client.get(url + "/api/report/stats", params={"report_name": REPORT})
+            self._ok(op, resp, resp.json() if resp.status_code < 400 else None)
+        else:
+            op = "config save"
+            resp = await client.post(
+                url + "/settings/openai", data={"endpoint": f"http://127.0.0.1:9/v{i}", "key": "fake-key"}
+            )
+            self._ok(op, resp)
+        self.latency[op].append(time.perf_counter() - start)
+
+    async def run(self, rename):
+        sem = asyncio.Semaphore(self.args.concurrency)
+        limits = httpx.Limits(max_connections=self.args.concurrency)
+        half = self.args.requests // 2
+        async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+
+            async def one(i):
+                async with sem:
+                    await self.request(client, i)
+
+            await asyncio.gather(*(one(i) for i in range(half)))
+            # between the halves, so no insert is in flight with the old field names
+            await rename(client)
+            await asyncio.gather(*(one(i) for i in range(half, self.args.requests)))
+
+
+def write_sections(path: str, n: int, threads: int = 4):
+    """Concurrent update_section calls from this process, each with its own store."""
+
+    def run(t):
+        store = ConfigStore(path)
+        for i in range(t, n, threads):
+            store.update_section(f"bench_{i}", {"n": i})
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for th in pool:
+        th.start()
+    return pool
+
+
+def all_records(url: str) -> list[dict]:
+    records, cursor = [], None
+    while True:
+        params = {"report_name": REPORT, "limit": 500}
+        if cursor:
+            params["cursor"] = cursor
+        page = httpx.get(url + "/api/report/records", params=params, timeout=60).json()
+        records += page["records"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--upload-every", type=int, default=10)
+    parser.add_argument("--config-writes", type=int, default=50)
+    parser.add_argument("--backend", choices=["tables", "json"], default="tables")
+    parser.add_argument("--group-commit", action="store_true")
+    args = parser.parse_args()
+
+    ctx = setup(args)
+    workers = start_workers(args.workers, ctx)
+    urls = [url for _, url in workers]
+    failures = []
+    try:
+        httpx.post(
+            urls[0] + "/report-types/new",
+            data={"name": REPORT, "source": "manual", "input_mode": "struct",
+                  "fields": FIELDS, "types": ["qa", "qa", "image"]},
+        )
+        rt_id = report_type_id(ctx)
+        for url in urls:
+            httpx.get(url + "/api/report/fields", params={"report_name": REPORT})
+        load = Load(urls, args)
+
+        async def rename(client):
+            resp = await client.post(
+                urls[0] + f"/report-types/{rt_id}/edit", data={"fields": [FIELDS[0], RENAMED, FIELDS[2]]}
+            )
+            load._ok("rename", resp)
+
+        writers = write_sections(ctx["config"], args.config_writes)
+        start = time.perf_counter()
+        asyncio.run(load.run(rename))
+        elapsed = time.perf_counter() - start
+        for th in writers:
+            th.join()
+
+        print(f"{args.workers} workers, {args.requests} requests, concurrency {args.concurrency}, "
+              f"backend {args.backend}: {args.requests / elapsed:.0f} req/s")
+        print(f"{'':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for op, lat in sorted(load.latency.items()):
+            lat = sorted(lat)
+            p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+            print(f"{op:<16}{len(lat):>8}{statistics.median(lat) * 1000:>10.1f}{p95 * 1000:>10.1f}{lat[-1] * 1000:>10.1f}")
+
+        if load.errors:
+            failures.append(f"{len(load.errors)} failed requests, e.g. {load.errors[0]}")
+        records = all_records(urls[-1])
+        if len(records) != load.inserted:
+            failures.append(f"{load.inserted} inserts acknowledged, {len(records)} stored")
+        missing = [r["id"] for r in records if not r.get(RENAMED) or not r.get(FIELDS[0])]
+        if missing:
+            failures.append(f"{len(missing)} records lost field values, e.g. id {missing[0]}")
+        images = {r[FIELDS[2]] for r in records if r.get(FIELDS[2])}
+        for url in urls:
+            for path in images:
+                if httpx.get(f"{url}/static/{path}").status_code != 200:
+                    failures.append(f"{path} not served by {url}")
+                    break
+
+        with open(ctx["config"], encoding="utf-8") as f:
+            config = json.load(f)
+        lost = [i for i in range(args.config_writes) if config.get(f"bench_{i}") != {"n": i}]
+        if lost:
+            failures.append(f"{len(lost)} config section updates lost")
+        endpoint = config["openai"]["endpoint"]
+        time.sleep(1.5)  # past ConfigStore.check_interval and shared_versions.CHECK_INTERVAL
+        for url in urls:
+            if f'value="{endpoint}"' not in httpx.get(url + "/settings/openai").text:
+                failures.append(f"{url} does not serve the latest config")
+            fields = httpx.get(url + "/api/report/fields", params={"report_name": REPORT}).json()
+            if fields.get("fields") != [FIELDS[0], RENAMED, FIELDS[2]]:
+                failures.append(f"{url} serves stale fields {fields}")
+        print(f"records {len(records)}, uploads {len(images)}, config sections {len(config)}")
+    finally:
+        for proc, _ in workers:
+            proc.terminate()
+        for proc, _ in workers:
+            proc.wait()
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
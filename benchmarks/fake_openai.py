@@ -0,0 +1,89 @@
+"""Local stand-in for the (Azure) OpenAI chat completion endpoint.
+
+The reply to a field extraction prompt is a JSON object with a dummy value
+for every field named in the prompt; anything else gets a fixed text.
+Latency is ``latency`` seconds plus up to ``jitter`` seconds, plus
+``per_1k_chars`` seconds per 1000 prompt characters to model prompt
+processing time on long inputs. With
+``"stream": true`` the reply is sent as SSE chunks of a few characters,
+the first after the latency and then one every ``token_interval`` seconds.
+
+In process:  configure_gateway(transport=httpx.ASGITransport(app=create_app(0.2)))
+Standalone:  python benchmarks/fake_openai.py --port 8001 --latency 0.2
+             then set the endpoint to http://127.0.0.1:8001 on the settings page
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+FIELD_RE = re.compile(r'^\s*"(.+?)": \{', re.MULTILINE)
+
+
+def _stream(content: str, model: str, token_interval: float):
+    async def chunks():
+        for i in range(0, len(content), 4):
+            if i:
+                await asyncio.sleep(token_interval)
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[i:i + 4]}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+def create_app(latency: float = 0.0, jitter: float = 0.0, token_interval: float = 0.02, per_1k_chars: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    app.state.calls = 0
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        prompt = body["messages"][-1]["content"]
+        await asyncio.sleep(latency + random.uniform(0, jitter) + per_1k_chars * len(prompt) / 1000)
+        fields = FIELD_RE.findall(prompt.split("**記載例**")[0])
+        if fields:
+            content = json.dumps({f: f"{f}の値" for f in fields}, ensure_ascii=False)
+        else:
+            content = "これはテスト用の応答です。" * 8
+        if body.get("stream"):
+            return _stream(content, body.get("model"), token_interval)
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 2, "completion_tokens": len(content) // 2,
+                      "total_tokens": (len(prompt) + len(content)) // 2},
+        }
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--per-1k-chars", type=float, default=0.0)
+    args = parser.parse_args()
+    app = create_app(args.latency, args.jitter, args.token_interval, args.per_1k_chars)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
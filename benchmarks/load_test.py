@@ -0,0 +1,314 @@
+"""Load test of the real FastAPI app against a fake OpenAI endpoint.
+
+Seeds report types with many fields and rows in a throwaway database, then
+drives the app in process through each scenario and reports throughput,
+p50/p95/p99 latency and peak RSS; the streaming chat scenario also reports
+time to first token. The in-process transport buffers whole responses, so
+that scenario serves the app and the fake endpoint with uvicorn on local
+ports instead. Results can be written as JSON and
+compared with a previous run.
+
+Usage: python benchmarks/load_test.py [--requests 200] [--concurrency 16]
+           [--fields 30] [--rows 20000] [--llm-latency 0.2]
+           [--scenarios record,parse,show_records,upload,excel,chat_stream]
+           [--out results.json] [--baseline baseline.json]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="genereport-load-")
+os.chdir(WORKDIR)
+os.symlink(os.path.join(ROOT, "templates"), "templates")
+os.makedirs("static", exist_ok=True)
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+FAKE_OPENAI_PORT = free_port()
+# only used by live scenarios; in-process ones route through ASGITransport
+os.environ.setdefault("OPENAI_ENDPOINT", f"http://127.0.0.1:{FAKE_OPENAI_PORT}")
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from openpyxl import Workbook  # noqa: E402
+from fake_openai import create_app as create_fake_openai  # noqa: E402
+from app.main import app  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app import crud  # noqa: E402
+from app.openai_util import configure_gateway  # noqa: E402
+
+SCENARIOS = ["record", "parse", "show_records", "upload", "excel", "chat_stream"]
+LIVE_SCENARIOS = {"chat_stream"}
+
+
+class ServerThread:
+    """Run an ASGI app with uvicorn in a background thread."""
+
+    def __init__(self, asgi_app, port: int):
+        self.url = f"http://127.0.0.1:{port}"
+        self.server = uvicorn.Server(
+            uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+        )
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def seed(n_fields: int, n_rows: int) -> dict:
+    db = SessionLocal()
+    fields = [f"項目{i}" for i in range(n_fields)]
+    struct = crud.create_report_type(
+        db, "bench_struct", fields, [f"{f}は?" for f in fields], ["qa"] * n_fields, "struct"
+    )
+    smart = crud.create_report_type(db, "bench_smart", fields, [], ["qa"] * n_fields, "smart", prompt="")
+    row = {f: f"{f}の値 サンプルテキスト" for f in fields}
+    for start in range(0, n_rows, 5000):
+        crud.bulk_insert_report_records(db, struct, [row] * min(5000, n_rows - start))
+    info = {"struct_id": struct.id, "smart_id": smart.id, "fields": fields}
+    db.close()
+    return info
+
+
+def upload_workbook(fields: list[str], rows: int = 100) -> bytes:
+    wb = Workbook()
+    ws = wb.active
+    ws.append(fields)
+    for i in range(rows):
+        ws.append([f"{f}-{i}" for f in fields])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def make_requests(info: dict):
+    fields = info["fields"]
+    record_form = {"report_name": "bench_struct", **{f: f"{f}の入力" for f in fields}}
+    workbook = upload_workbook(fields)
+
+    def record(client, i):
+        return client.post("/api/report/record", data=record_form)
+
+    def parse(client, i):
+        return client.post(
+            "/api/report/parse",
+            json={"report_name": "bench_smart", "text": f"報告メモ {i}", "use_cache": False},
+        )
+
+    def show_records(client, i):
+        return client.get(f"/report-types/{info['struct_id']}")
+
+    def upload(client, i):
+        return client.post(
+            f"/report-types/{info['struct_id']}/upload",
+            files={"file": ("bench.xlsx", workbook)},
+            headers={"accept": "application/json"},
+        )
+
+    def excel(client, i):
+        return client.get(f"/report-types/{info['struct_id']}/records/{i % 1000 + 1}/excel")
+
+    async def chat_stream(client, i):
+        # returns (response, seconds until the first delta event)
+        start = time.perf_counter()
+        ttft = None
+        async with client.stream("POST", "/chat/stream", data={"message": f"質問 {i}"}) as response:
+            async for line in response.aiter_lines():
+                if ttft is None and line == "event: delta":
+                    ttft = time.perf_counter() - start
+                elif line == "event: error":
+                    return httpx.Response(500), ttft
+        return response, ttft
+
+    return {
+        "record": record,
+        "parse": parse,
+        "show_records": show_records,
+        "upload": upload,
+        "excel": excel,
+        "chat_stream": chat_stream,
+    }
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def run_scenario(client, request, n: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    ttfts: list[float] = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await request(client, i)
+            except Exception:
+                # the in-process transport re-raises unhandled app errors
+                latencies.append(time.perf_counter() - start)
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+            if isinstance(response, tuple):
+                response, ttft = response
+                if ttft is not None:
+                    ttfts.append(ttft)
+            if response.status_code >= 400:
+                errors += 1
+            elif response.headers.get("content-type", "").startswith("application/json"):
+                body = response.json()
+                if isinstance(body, dict) and "error" in body:
+                    errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(n)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    ttfts.sort()
+    stats = {
+        "requests": n,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(n / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if ttfts:
+        stats["ttft_p50_ms"] = round(percentile(ttfts, 50) * 1000, 2)
+        stats["ttft_p95_ms"] = round(percentile(ttfts, 95) * 1000, 2)
+    return stats
+
+
+def compare(results: dict, baseline: dict):
+    print("\nvs baseline")
+    for name, cur in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        tput = (cur["throughput"] / base["throughput"] - 1) * 100 if base["throughput"] else 0.0
+        p95 = (cur["p95_ms"] / base["p95_ms"] - 1) * 100 if base["p95_ms"] else 0.0
+        line = f"  {name:<13} throughput {tput:+6.1f}%   p95 {p95:+6.1f}%"
+        if cur.get("ttft_p95_ms") and base.get("ttft_p95_ms"):
+            line += f"   ttft p95 {(cur['ttft_p95_ms'] / base['ttft_p95_ms'] - 1) * 100:+6.1f}%"
+        print(line)
+
+
+async def run_live(request, args) -> dict:
+    fake = create_fake_openai(args.llm_latency, args.llm_jitter)
+    with ServerThread(fake, FAKE_OPENAI_PORT), ServerThread(app, free_port()) as server:
+        configure_gateway()
+        try:
+            async with httpx.AsyncClient(base_url=server.url, timeout=None) as client:
+                return await run_scenario(client, request, args.requests, args.concurrency)
+        finally:
+            configure_gateway(transport=httpx.ASGITransport(app=fake))
+
+
+async def main_async(args) -> dict:
+    configure_gateway(transport=httpx.ASGITransport(app=create_fake_openai(args.llm_latency, args.llm_jitter)))
+    # the lifespan creates the schema, so seeding happens inside it
+    async with app.router.lifespan_context(app):
+        return await run_all(args)
+
+
+async def run_all(args) -> dict:
+    info = seed(args.fields, args.rows)
+    requests = make_requests(info)
+    results = {
+        "meta": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "fields": args.fields,
+            "rows": args.rows,
+            "llm_latency": args.llm_latency,
+            "python": platform.python_version(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "scenarios": {},
+    }
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name in args.scenarios:
+            if name in LIVE_SCENARIOS:
+                stats = await run_live(requests[name], args)
+            else:
+                stats = await run_scenario(client, requests[name], args.requests, args.concurrency)
+            results["scenarios"][name] = stats
+            print(
+                f"{name:<13} {stats['throughput']:>9.1f} req/s  p50 {stats['p50_ms']:>8.1f}ms  "
+                f"p95 {stats['p95_ms']:>8.1f}ms  p99 {stats['p99_ms']:>8.1f}ms  "
+                f"rss {stats['peak_rss_mb']:>7.1f}MB  errors {stats['errors']}"
+            )
+            if "ttft_p50_ms" in stats:
+                print(f"{'':<13} time to first token p50 {stats['ttft_p50_ms']:.1f}ms  p95 {stats['ttft_p95_ms']:.1f}ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fields", type=int, default=30)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--out")
+    parser.add_argument("--baseline")
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(main_async(args))
+    if args.out:
+        with open(os.path.join(ROOT, args.out) if not os.path.isabs(args.out) else args.out, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        path = args.baseline if os.path.isabs(args.baseline) else os.path.join(ROOT, args.baseline)
+        with open(path) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()